@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "part1"))
+
+from part1 import KEYRING, batch_verify, find_invalid_signatures, sign_message, verify_signature
+
+SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(max_size=SIZES[-1]):
+    key = KEYRING["Inventory A"]
+    pub = key.public_key
+    sizes = [size for size in SIZES if size <= max_size]
+    msgs = [f"Item: {i:06d} | QTY: {i % 50 + 1} | Price: {i % 90 + 10}" for i in range(sizes[-1])]
+    sigs = [sign_message(msg, key) for msg in msgs]
+    print(f"{'size':>7} {'loop':>10} {'batch':>10} {'speedup':>8} {'1 bad, bisect':>14}")
+    for size in sizes:
+        m, s = msgs[:size], sigs[:size]
+        ok, loop = timed(lambda: all(verify_signature(x, y, pub) for x, y in zip(m, s)))
+        batch_ok, batch = timed(lambda: batch_verify(m, s, pub))
+        assert ok and batch_ok
+        tampered = list(s)
+        tampered[size // 3] += 1
+        bad, bisect = timed(lambda: find_invalid_signatures(m, tampered, pub))
+        assert bad == [size // 3]
+        print(f"{size:>7} {loop * 1e3:>8.2f}ms {batch * 1e3:>8.2f}ms {loop / batch:>7.1f}x {bisect * 1e3:>12.2f}ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1])
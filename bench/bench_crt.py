@@ -0,0 +1,27 @@
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.keys import RSAKey
+
+KEYS = {
+    "Inventory A": (1210613765735147311106936311866593978079938707, 1247842850282035753615951347964437248190231863, 815459040813953176289801),
+    "Procurement": (1080954735722463992988394149602856332100628417, 1158106283320086444890911863299879973542293243, 106506253943651610547613),
+}
+
+
+def main(number=2000):
+    for label, (p, q, e) in KEYS.items():
+        crt = RSAKey.from_primes(p, q, e)
+        plain = RSAKey(e, p * q, d=crt.d, use_crt=False)
+        m = 0x5EED % crt.n
+        full = min(timeit.repeat(lambda: plain.private_op(m), number=number, repeat=3)) / number
+        fast = min(timeit.repeat(lambda: crt.private_op(m), number=number, repeat=3)) / number
+        print(f"{label:12} full pow {full * 1e6:8.2f} us | CRT + fault check {fast * 1e6:8.2f} us | {full / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
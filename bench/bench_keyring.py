@@ -0,0 +1,37 @@
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "part1"))
+
+from part1 import KEYRING, generate_rsa_keys, inventory_keys, sign_message
+
+
+def per_request_derive(node, msg):
+    keys = inventory_keys[node]
+    pub_key, priv_key, n, phi, d = generate_rsa_keys(keys["p"], keys["q"], keys["e"])
+    return sign_message(msg, priv_key)
+
+
+def per_request_keyring(node, msg):
+    return sign_message(msg, KEYRING[node].private_key)
+
+
+def main(number=2000):
+    node = "Inventory A"
+    msg = "Item: 005 | QTY: 10 | Price: 20"
+    derive = min(timeit.repeat(lambda: generate_rsa_keys(**inventory_keys[node]), number=number, repeat=3)) / number
+    lookup = min(timeit.repeat(lambda: KEYRING[node], number=number, repeat=3)) / number
+    old = min(timeit.repeat(lambda: per_request_derive(node, msg), number=number, repeat=3)) / number
+    new = min(timeit.repeat(lambda: per_request_keyring(node, msg), number=number, repeat=3)) / number
+    print(f"key derivation per request : {derive * 1e6:9.2f} us")
+    print(f"keyring lookup per request : {lookup * 1e6:9.2f} us")
+    print(f"derive + sign per request  : {old * 1e6:9.2f} us")
+    print(f"keyring + sign per request : {new * 1e6:9.2f} us")
+    print(f"saving per request         : {(old - new) * 1e6:9.2f} us ({(old - new) / old:.0%})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,256 @@
+"""Drive part1 submissions and part2 lookups at a set rate and concurrency.
+
+    python bench/loadgen.py --requests 2000 --concurrency 16 --rate 200
+    python bench/loadgen.py --part1-url http://127.0.0.1:5000 --part2-url http://127.0.0.1:5001 \\
+        --duration 30 --mix new=0.4,repeat=0.5,missing=0.1 --data-dir DATA
+
+Each request is one of:
+
+    new      part1 form submission of a fresh item ID
+    repeat   part2 lookup of an ID known to exist (shipped or created earlier)
+    missing  part2 lookup of an ID that does not exist
+
+part2 reads the replicas through an index refreshed at most once per
+--staleness seconds, so a lookup that misses an item created within that
+window is reported as a stale read rather than an error.
+
+Without URLs both apps run in-process through Flask's test client against a
+scratch copy of DATA. Afterwards the four replicas are compared by Merkle root;
+the exit status is 1 if there were errors or the replicas disagree.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from run import ROOT, import_app, scratch_workspace
+
+from common.anti_entropy import divergent_ids
+from common.backends import BACKEND, open_replicas
+from common.parameters import INVENTORY_KEYS
+
+KINDS = ["new", "repeat", "missing"]
+STALE = object()
+
+
+def parse_mix(text):
+    weights = dict.fromkeys(KINDS, 0.0)
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in weights:
+            raise argparse.ArgumentTypeError(f"unknown request kind {kind!r}, expected one of {KINDS}")
+        weights[kind] = float(weight)
+    if not sum(weights.values()) > 0:
+        raise argparse.ArgumentTypeError("mix weights must add up to more than zero")
+    return weights
+
+
+class TestClientTarget:
+    """Both apps in this process; one test client per worker thread."""
+
+    def __init__(self):
+        self.apps = {"part1": import_app("part1").app, "part2": import_app("part2").app}
+        self._local = threading.local()
+
+    def post_form(self, part, form):
+        clients = getattr(self._local, "clients", None)
+        if clients is None:
+            clients = self._local.clients = {name: app.test_client() for name, app in self.apps.items()}
+        resp = clients[part].post("/", data=form)
+        return resp.status_code, resp.get_data(as_text=True)
+
+
+class HTTPTarget:
+    def __init__(self, urls, timeout=10.0):
+        self.urls = urls
+        self.timeout = timeout
+
+    def post_form(self, part, form):
+        req = urllib.request.Request(self.urls[part].rstrip("/") + "/", data=urllib.parse.urlencode(form).encode())
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, resp.read().decode()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read().decode(errors="replace")
+
+
+def known_ids(data_dir, backend):
+    replicas = open_replicas(backend, readonly=True, data_dir=data_dir)
+    try:
+        return sorted({record["ID"] for record in replicas["A"]})
+    finally:
+        replicas.close()
+
+
+class LoadGenerator:
+    def __init__(self, target, mix, seed_ids, rate=0.0, seed=None, staleness=1.0):
+        self.target = target
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.rate = rate
+        self.rng = random.Random(seed)
+        self.nodes = list(INVENTORY_KEYS)
+        self.known = list(seed_ids)
+        self.created = {}
+        self.staleness = staleness
+        self.run_tag = f"{self.rng.getrandbits(32):08x}"
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def next_request(self):
+        with self._lock:
+            i = next(self._counter)
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            if kind == "new":
+                form = {"node": self.rng.choice(self.nodes), "item_id": f"{self.run_tag}{i:04x}",
+                        "qty": self.rng.randint(1, 100), "price": self.rng.randint(1, 500)}
+            elif kind == "repeat" and self.known:
+                form = {"item_id": self.rng.choice(self.known)}
+            else:
+                kind = "missing"
+                form = {"item_id": f"{self.run_tag}m{i:03x}"}
+        return i, kind, form
+
+    def one(self, start):
+        i, kind, form = self.next_request()
+        if self.rate:
+            delay = start + i / self.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent = time.perf_counter()
+        try:
+            status, body = self.target.post_form("part1" if kind == "new" else "part2", form)
+        except (OSError, ValueError) as exc:
+            return kind, time.perf_counter() - sent, f"{type(exc).__name__}: {exc}"
+        elapsed = time.perf_counter() - sent
+        if status != 200:
+            return kind, elapsed, f"HTTP {status}"
+        if kind == "new":
+            if "Consensus Achieved" not in body:
+                return kind, elapsed, "consensus failed"
+            with self._lock:
+                self.known.append(form["item_id"])
+                self.created[form["item_id"]] = time.perf_counter()
+        elif kind == "repeat" and "not found" in body:
+            created = self.created.get(form["item_id"])
+            if created is not None and sent - created < self.staleness:
+                return kind, elapsed, STALE
+            return kind, elapsed, "known item not found"
+        elif kind == "missing" and "not found" not in body:
+            return kind, elapsed, "missing item was found"
+        return kind, elapsed, None
+
+    def run(self, requests=None, duration=None, concurrency=8):
+        start = time.perf_counter()
+        deadline = start + duration if duration else None
+        latencies = {kind: [] for kind in KINDS}
+        errors = {}
+        stale = 0
+
+        def worker():
+            done = []
+            while deadline is None or time.perf_counter() < deadline:
+                if requests is not None:
+                    with self._lock:
+                        if self._issued >= requests:
+                            break
+                        self._issued += 1
+                done.append(self.one(start))
+            return done
+
+        self._issued = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(worker) for _ in range(concurrency)]
+            outcomes = [outcome for future in futures for outcome in future.result()]
+        total = time.perf_counter() - start
+
+        for kind, elapsed, error in outcomes:
+            latencies[kind].append(elapsed)
+            if error is STALE:
+                stale += 1
+            elif error:
+                errors[error] = errors.get(error, 0) + 1
+        return {
+            "requests": len(outcomes),
+            "seconds": total,
+            "throughput": len(outcomes) / total if total else 0.0,
+            "errors": sum(errors.values()),
+            "error_kinds": errors,
+            "stale_reads": stale,
+            "latency_ms": summarise(sum(latencies.values(), [])),
+            "by_kind": {kind: dict(count=len(values), **summarise(values))
+                        for kind, values in latencies.items() if values},
+        }
+
+
+def summarise(latencies):
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    pct = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1e3
+    return {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": ordered[-1] * 1e3}
+
+
+def check_replicas(data_dir, backend):
+    replicas = open_replicas(backend, readonly=True, data_dir=data_dir)
+    try:
+        ids, _, roots = divergent_ids(replicas)
+        return {"agree": not ids, "divergent_ids": sorted(ids)[:20], "divergent_count": len(ids),
+                "roots": roots, "records": {letter: len(replica) for letter, replica in replicas.items()}}
+    finally:
+        replicas.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--part1-url", help="running part1 server (default: in-process test client)")
+    parser.add_argument("--part2-url", help="running part2 server (default: in-process test client)")
+    parser.add_argument("--data-dir", default="DATA", help="replica directory to check when using URLs")
+    parser.add_argument("--backend", default=BACKEND)
+    parser.add_argument("--requests", type=int, help="total requests (default 1000 unless --duration)")
+    parser.add_argument("--duration", type=float, help="run for this many seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0.0, help="target requests per second, 0 = as fast as possible")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("new=0.3,repeat=0.5,missing=0.2"))
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--staleness", type=float, default=1.0,
+                        help="seconds a new item may take to become visible to part2")
+    args = parser.parse_args(argv)
+    if bool(args.part1_url) != bool(args.part2_url):
+        parser.error("give both --part1-url and --part2-url, or neither")
+    requests = args.requests if args.requests or args.duration else 1000
+
+    workdir = None
+    if args.part1_url:
+        target = HTTPTarget({"part1": args.part1_url, "part2": args.part2_url})
+        data_dir = args.data_dir
+    else:
+        workdir = scratch_workspace()
+        target = TestClientTarget()
+        data_dir = os.path.join(workdir, "DATA")
+    try:
+        generator = LoadGenerator(target, args.mix, known_ids(data_dir, args.backend), args.rate, args.seed,
+                                  args.staleness)
+        report = generator.run(requests, args.duration, args.concurrency)
+        report["replicas"] = check_replicas(data_dir, args.backend)
+    finally:
+        if workdir:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+    report["config"] = {"concurrency": args.concurrency, "rate": args.rate, "mix": args.mix,
+                        "backend": args.backend, "target": args.part1_url and "http" or "test-client"}
+    print(json.dumps(report, indent=2, sort_keys=True))
+    return 1 if report["errors"] or not report["replicas"]["agree"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
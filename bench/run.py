@@ -0,0 +1,275 @@
+"""End-to-end benchmark suite.
+
+    python bench/run.py --out bench/results.json
+    python bench/run.py --quick --baseline bench/baseline.json --threshold 0.25
+    python bench/run.py --only storage --sizes 10,1000,1000000
+
+Times key derivation, signing and verification across key sizes, a full part1
+consensus round, the replica write path and load_record across inventory
+sizes, the part2 multisig + encrypt pipeline, and how long a fresh process
+takes to import each app with and without a current parameter cache
+(common.paramcache). Everything runs against a
+scratch copy of DATA, so the real replicas are never touched. Results are JSON;
+with --baseline each case is compared against a stored run and the exit
+status is 1 if any case got slower than the threshold allows.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.backends import BACKEND, open_replicas
+from common.keygen import generate_node_key
+from common.keys import RSAKey
+from common.paramcache import CACHE_FILE
+from common.parameters import INVENTORY_KEYS
+from common.signatures import sign_message, verify_signature
+
+SUITES = ["crypto", "consensus", "storage", "query", "startup"]
+KEY_BITS = [300, 1024, 2048, 3072]
+QUICK_KEY_BITS = [300, 1024]
+SIZES = [10, 100, 1000, 10000, 100000, 1000000]
+QUICK_SIZES = [10, 1000, 10000]
+
+
+def measure(fn, repeat=5, min_time=0.2):
+    """Per-call timings in seconds: best and median of `repeat` runs."""
+    timer = timeit.Timer(fn)
+    number, total = timer.autorange()
+    number = max(1, int(number * min_time / max(total, 1e-9)))
+    runs = sorted(t / number for t in timer.repeat(repeat=repeat, number=number))
+    return {"min_s": runs[0], "median_s": runs[len(runs) // 2], "calls": number * repeat}
+
+
+def scratch_workspace():
+    """Copy DATA and parameters.txt to a temp dir and make it the working directory."""
+    workdir = tempfile.mkdtemp(prefix="inventory-bench-")
+    shutil.copytree(os.path.join(ROOT, "DATA"), os.path.join(workdir, "DATA"),
+                    ignore=shutil.ignore_patterns("nodes", "commitlog", "*.log", "*.snapshot.json",
+                                                  "*.applied.json", "*.sqlite3*", "*.bin", "*.cache"))
+    shutil.copy(os.path.join(ROOT, "parameters.txt"), workdir)
+    os.chdir(workdir)
+    return workdir
+
+
+def import_app(part):
+    sys.path.insert(0, os.path.join(ROOT, part))
+    return __import__(part)
+
+
+def node_key(bits):
+    """The shipped ~300-bit key for 300, otherwise a freshly generated key of that size."""
+    if bits == 300:
+        params = INVENTORY_KEYS["Inventory A"]
+    else:
+        params = generate_node_key(bits)
+    return params, RSAKey.from_primes(params["p"], params["q"], params["e"])
+
+
+def bench_crypto(key_bits, results):
+    part1 = import_app("part1")
+    counter = itertools.count()
+    for bits in key_bits:
+        params, key = node_key(bits)
+        label = f"bits={key.n.bit_length()}"
+        msg = "Item: 005 | QTY: 10 | Price: 20"
+        signature = sign_message(msg, key)
+        results[f"crypto.generate_rsa_keys[{label}]"] = measure(
+            lambda: part1.generate_rsa_keys(params["p"], params["q"], params["e"]))
+        results[f"crypto.sign_message[{label}]"] = measure(
+            lambda: sign_message(f"Item: {next(counter)} | QTY: 10 | Price: 20", key))
+        results[f"crypto.verify_signature[{label}]"] = measure(
+            lambda: verify_signature(msg, signature, key.public_key))
+
+
+def bench_consensus(results):
+    part1 = import_app("part1")
+    client = part1.app.test_client()
+    counter = itertools.count()
+    nodes = part1.KEYRING.nodes()
+
+    def round_trip():
+        i = next(counter)
+        resp = client.post("/", data={"node": nodes[i % len(nodes)], "item_id": f"BENCH{i}", "qty": 1, "price": 1})
+        assert resp.status_code == 200
+
+    def consensus_only():
+        msg = f"Item: BENCH{next(counter)} | QTY: 1 | Price: 1"
+        key = part1.KEYRING["Inventory A"]
+        signature = sign_message(msg, key)
+        part1.CONSENSUS.run({node: (verify_signature, (msg, signature, key.public_key)) for node in part1.KEYRING})
+
+    results["consensus.round[sign+verify x4]"] = measure(consensus_only)
+    results["consensus.part1_submission[http]"] = measure(round_trip)
+
+
+def make_replicas(data_dir, size):
+    os.makedirs(data_dir, exist_ok=True)
+    records = [{"ID": f"{i:07d}", "QTY": i % 50 + 1, "Price": i % 90 + 10, "Location": "ABCD"[i % 4]}
+               for i in range(size)]
+    for letter in "abcd":
+        with open(os.path.join(data_dir, f"inventory_{letter}.json"), "w") as f:
+            json.dump(records, f)
+    return [record["ID"] for record in records]
+
+
+def bench_storage(sizes, backend, results):
+    part2 = import_app("part2")
+    for size in sizes:
+        data_dir = os.path.abspath(f"sized-{size}")
+        ids = make_replicas(data_dir, size)
+        start = time.perf_counter()
+        writer = open_replicas(backend, data_dir=data_dir)
+        elapsed = time.perf_counter() - start
+        results[f"storage.open[backend={backend},records={size}]"] = {"min_s": elapsed, "median_s": elapsed, "calls": 1}
+        counter = itertools.count(size)
+
+        def write():
+            i = next(counter)
+            writer.commit([{"ID": f"{i:07d}", "QTY": 1, "Price": 1, "Location": "A"}])
+
+        results[f"storage.commit[backend={backend},records={size}]"] = measure(write, repeat=3, min_time=0.1)
+
+        part2.STORE = open_replicas(backend, readonly=True, data_dir=data_dir)
+        rng = random.Random(size)
+        results[f"storage.load_record[backend={backend},records={size}]"] = measure(
+            lambda: part2.load_record("A", rng.choice(ids)))
+        results[f"storage.load_record_missing[backend={backend},records={size}]"] = measure(
+            lambda: part2.load_record("A", "missing"))
+        part2.STORE.close()
+        writer.close()
+        shutil.rmtree(data_dir)
+
+
+def bench_query(results):
+    part2 = import_app("part2")
+    counter = itertools.count()
+
+    def pipeline():
+        msg = f"Query digest: {next(counter)}"
+        messages = {label: msg for label in part2.IDENTITIES}
+        agg = part2.MULTISIG.aggregate(part2.MULTISIG.sign_round(messages).values())
+        assert part2.MULTISIG.verify(agg, messages)
+        part2.encrypt_envelope(json.dumps({"digest": msg, "aggregated": agg}).encode(),
+                               part2.PROCUREMENT_KEY.public_key)
+
+    results["query.multisig_encrypt"] = measure(pipeline)
+    client = part2.app.test_client()
+    results["query.task3_ui[http]"] = measure(lambda: client.post("/", data={"item_id": "001"}))
+
+
+def bench_startup(results):
+    """Import time of each app, with and without a current parameter cache.
+
+    Flask is imported eagerly and accounts for most of either figure."""
+    for part in ("part1", "part2"):
+        command = [sys.executable, "-c", f"import sys; sys.path.insert(0, {os.path.join(ROOT, part)!r}); import {part}"]
+
+        def warm(command=command):
+            subprocess.run(command, check=True)
+
+        def cold(command=command):
+            if os.path.exists(CACHE_FILE):
+                os.remove(CACHE_FILE)
+            subprocess.run(command, check=True)
+
+        warm()
+        results[f"startup.import[{part}]"] = measure(warm, repeat=3)
+        results[f"startup.import[{part},no-cache]"] = measure(cold, repeat=3)
+
+
+def compare(results, baseline, threshold):
+    """Cases slower than baseline * (1 + threshold), by best time."""
+    regressions = {}
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None or name.startswith("storage.open"):
+            continue
+        ratio = current["min_s"] / before["min_s"]
+        if ratio > 1 + threshold:
+            regressions[name] = {"baseline_s": before["min_s"], "current_s": current["min_s"], "ratio": ratio}
+    return regressions
+
+
+def parse_ints(text):
+    return [int(part) for part in text.split(",") if part]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", action="append", choices=SUITES, help="run just this suite (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="small key and inventory sizes only")
+    parser.add_argument("--bits", type=parse_ints, help="comma-separated key sizes (300 = the shipped keys)")
+    parser.add_argument("--sizes", type=parse_ints, help="comma-separated inventory sizes")
+    parser.add_argument("--backend", default=BACKEND)
+    parser.add_argument("--out", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    suites = args.only or SUITES
+    key_bits = args.bits or (QUICK_KEY_BITS if args.quick else KEY_BITS)
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    workdir = scratch_workspace()
+    results = {}
+    try:
+        if "crypto" in suites:
+            bench_crypto(key_bits, results)
+        if "consensus" in suites:
+            bench_consensus(results)
+        if "storage" in suites:
+            bench_storage(sizes, args.backend, results)
+        if "query" in suites:
+            bench_query(results)
+        if "startup" in suites:
+            bench_startup(results)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": args.backend,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+    if baseline is not None:
+        report["regressions"] = compare(results, baseline, args.threshold)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if report.get("regressions"):
+        for name, info in sorted(report["regressions"].items()):
+            print(f"REGRESSION {name}: {info['baseline_s'] * 1e6:.1f} us -> {info['current_s'] * 1e6:.1f} us "
+                  f"({info['ratio']:.2f}x)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Find and repair divergence between inventory replicas by Merkle comparison.
+
+    python -m common.anti_entropy [--dry-run] [--backend commitlog] [DATA_DIR]
+
+Run the command line form only while part1 is stopped; a running part1
+exposes the same repair as POST /repair.
+"""
+import argparse
+import json
+import sys
+
+from common.merkle import canonical, diff_trees
+from common.backends import BACKEND, open_replicas
+from common.txlog import DATA_DIR
+
+
+def divergent_ids(replicas):
+    """Compare every replica's tree against the most common root."""
+    groups = {}
+    for letter, replica in replicas.items():
+        groups.setdefault(replica.merkle.root, []).append(letter)
+    reference = replicas[max(groups.values(), key=len)[0]]
+    ids = set()
+    exchanges = 0
+    for replica in replicas.values():
+        if replica is not reference:
+            found, count = diff_trees(reference.merkle, replica.merkle)
+            ids |= found
+            exchanges += count
+    return ids, exchanges, {root.hex(): letters for root, letters in groups.items()}
+
+
+def majority(replicas, item_id):
+    votes = {}
+    for letter, replica in replicas.items():
+        records = replica.get_all(item_id)
+        key = tuple(canonical(r) for r in records)
+        votes.setdefault(key, {"records": records, "replicas": []})["replicas"].append(letter)
+    best = max(votes.values(), key=lambda v: len(v["replicas"]))
+    if len(best["replicas"]) * 2 <= len(replicas):
+        return None, votes
+    return best, votes
+
+
+def repair(replicas, dry_run=False):
+    ids, exchanges, roots = divergent_ids(replicas)
+    repaired, unresolved = [], []
+    for item_id in sorted(ids):
+        best, votes = majority(replicas, item_id)
+        if best is None:
+            unresolved.append(item_id)
+            continue
+        for letter, replica in replicas.items():
+            if letter not in best["replicas"]:
+                repaired.append({"id": item_id, "replica": letter, "records": best["records"]})
+                if not dry_run:
+                    replica.put(item_id, best["records"])
+    return {
+        "roots": roots,
+        "exchanges": exchanges,
+        "divergent_ids": sorted(ids),
+        "repaired": repaired,
+        "unresolved": unresolved,
+        "dry_run": dry_run,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    parser.add_argument("--backend", default=BACKEND)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    replicas = open_replicas(args.backend, readonly=args.dry_run, data_dir=args.data_dir)
+    try:
+        json.dump(repair(replicas, args.dry_run), sys.stdout, indent=2)
+    finally:
+        replicas.close()
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Crash-safe file replacement.
+
+Every rewrite of a replica, snapshot, checkpoint, key file or cache goes
+through atomic_open(): the new contents are written to a temp file next to
+the target, fsynced, renamed over it, and the directory is fsynced so the
+rename itself survives a crash. A reader sees the old file or the new one,
+never a torn mix.
+"""
+import os
+from contextlib import contextmanager, suppress
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Some platforms and filesystems cannot fsync a directory.
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path, mode="wb", **kwargs):
+    """Open a temp file to write; on a clean exit it replaces path, else it is removed."""
+    # A per-process temp name, since several workers may rewrite the same file.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    f = open(tmp, mode, **kwargs)
+    try:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    except BaseException:
+        f.close()
+        with suppress(OSError):
+            os.unlink(tmp)
+        raise
+    f.close()
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def write_atomic(path, data):
+    with atomic_open(path, "wb") as f:
+        f.write(data)
@@ -0,0 +1,629 @@
+"""Pluggable storage backends for the inventory replicas.
+
+Both apps open their replicas through open_replicas(), choosing the backend
+with INVENTORY_BACKEND:
+
+    commitlog  one shared commit log, replayed by each replica from its cursor (default)
+    log        snapshot + append-only log per replica
+    sqlite     one SQLite database per replica, WAL mode, indexed on ID and Location
+    json       the original whole-file JSON arrays
+    binary     read-only mmap'd fixed-width files (see common.binfmt)
+
+Only json keeps DATA/inventory_<x>.json current; python -m common.export
+writes them out from any other backend.
+"""
+import os
+import threading
+import time
+
+from common import jsonstream
+from common.commitlog import CommitLog, CursorReplica
+from common.inventory_store import ReplicaIndex
+from common.merkle import BucketMerkleTree
+from common.txlog import DATA_DIR, ReplicaLog, file_version, replica_base
+
+BACKEND = os.environ.get("INVENTORY_BACKEND", "commitlog")
+
+
+def _disk_footprint(records, resident, paths):
+    """footprint() for backends that keep records on disk rather than in memory."""
+    disk = sum((file_version(path) or (0, 0))[1] for path in paths)
+    return {
+        "records": records,
+        "bytes": resident,
+        "bytes_per_million": int(resident / records * 1_000_000) if records else 0,
+        "disk_bytes": disk,
+        "disk_bytes_per_million": int(disk / records * 1_000_000) if records else 0,
+    }
+
+
+class ReplicaBackend:
+    """What the apps need from one replica.
+
+    get() returns the first record stored under an ID, as the original linear
+    scan did. put() makes the given records the only ones under an ID, and
+    upsert() does that for a batch, keeping an existing ID in its place."""
+
+    readonly = False
+
+    @classmethod
+    def open_set(cls, data_dir, letters, readonly):
+        return ReplicaSet({letter: cls(replica_base(letter, data_dir), readonly=readonly) for letter in letters})
+
+    def get(self, item_id):
+        raise NotImplementedError
+
+    def get_all(self, item_id):
+        record = self.get(item_id)
+        return [] if record is None else [record]
+
+    def get_many(self, item_ids):
+        return {item_id: self.get(item_id) for item_id in item_ids}
+
+    def version(self, item_id):
+        """A value that changes whenever the records under item_id may have.
+
+        Backends that cannot track single items return a replica-wide one."""
+        raise NotImplementedError
+
+    def scan(self, predicate, location=None):
+        """Records matching predicate; location is a hint backends with an index may use."""
+        return [record for record in self if predicate(record)]
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        raise PermissionError(f"{type(self).__name__} is read-only")
+
+    def put(self, item_id, records):
+        raise PermissionError(f"{type(self).__name__} is read-only")
+
+    def upsert(self, records):
+        for record in records:
+            self.put(record["ID"], [record])
+
+    @property
+    def merkle(self):
+        return BucketMerkleTree.build(self)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def footprint(self):
+        return {}
+
+    def export_json(self, path):
+        """Write the replica's records to path as a JSON array; returns the count."""
+        return jsonstream.rewrite(path, iter(self))
+
+    def close(self):
+        pass
+
+
+class LogBackend(ReplicaBackend):
+    def __init__(self, base_path, readonly=False):
+        self.readonly = readonly
+        if readonly:
+            self.index = ReplicaIndex(base_path)
+        else:
+            self.replica = ReplicaLog(base_path)
+
+    def get(self, item_id):
+        if self.readonly:
+            return self.index.get(item_id)
+        found = self.replica.get_all(item_id)
+        return found[0] if found else None
+
+    def get_all(self, item_id):
+        if self.readonly:
+            return super().get_all(item_id)
+        return self.replica.get_all(item_id)
+
+    def get_many(self, item_ids):
+        if self.readonly:
+            return self.index.get_many(item_ids)
+        return super().get_many(item_ids)
+
+    def version(self, item_id):
+        if self.readonly:
+            return self.index.version(item_id)
+        return (self.replica.generation, self.replica.log_offset)
+
+    def scan(self, predicate, location=None):
+        if self.readonly:
+            return self.index.scan(predicate)
+        return super().scan(predicate)
+
+    def __iter__(self):
+        if self.readonly:
+            return iter(self.index.scan(lambda r: True))
+        return iter(self.replica)
+
+    def __len__(self):
+        return len(self.index.index) if self.readonly else len(self.replica)
+
+    def extend(self, records):
+        if self.readonly:
+            return super().extend(records)
+        self.replica.extend(records)
+
+    def put(self, item_id, records):
+        if self.readonly:
+            return super().put(item_id, records)
+        self.replica.put(item_id, records)
+
+    def upsert(self, records):
+        if self.readonly:
+            return super().upsert(records)
+        self.replica.upsert(records)
+
+    @property
+    def merkle(self):
+        return super().merkle if self.readonly else self.replica.merkle
+
+    def footprint(self):
+        return self.index.footprint() if self.readonly else {}
+
+    def close(self):
+        if not self.readonly:
+            self.replica.close()
+
+
+class JSONBackend(ReplicaBackend):
+    """The original format. Reads stream the array a record at a time and
+    writes stream a rewritten copy, so neither holds the replica in memory."""
+
+    def __init__(self, base_path, readonly=False):
+        self.path = base_path + ".json"
+        self.readonly = readonly
+        self._lock = threading.Lock()
+
+    def get(self, item_id):
+        return jsonstream.find_record(self.path, item_id)
+
+    def get_all(self, item_id):
+        return list(jsonstream.scan(self.path, lambda item: item["ID"] == item_id))
+
+    def version(self, item_id):
+        return file_version(self.path)
+
+    def scan(self, predicate, location=None):
+        return list(jsonstream.scan(self.path, predicate))
+
+    def __iter__(self):
+        return jsonstream.read_records(self.path)
+
+    def _rewrite(self, transform):
+        if self.readonly:
+            raise PermissionError(f"{self.path} is open read-only")
+        with self._lock:
+            jsonstream.rewrite(self.path, transform(jsonstream.read_records(self.path)))
+
+    def extend(self, records):
+        def transform(items):
+            yield from items
+            yield from records
+        self._rewrite(transform)
+
+    def put(self, item_id, records):
+        def transform(items):
+            placed = False
+            for item in items:
+                if item["ID"] != item_id:
+                    yield item
+                elif not placed:
+                    yield from records
+                    placed = True
+            if not placed:
+                yield from records
+        self._rewrite(transform)
+
+    def upsert(self, records):
+        latest = {record["ID"]: record for record in records}
+
+        def transform(items):
+            placed = set()
+            for item in items:
+                item_id = item["ID"]
+                if item_id not in latest:
+                    yield item
+                elif item_id not in placed:
+                    yield latest[item_id]
+                    placed.add(item_id)
+            yield from (record for item_id, record in latest.items() if item_id not in placed)
+        self._rewrite(transform)
+
+    def footprint(self):
+        # Reads stream the file, so nothing stays resident between calls.
+        return _disk_footprint(len(self), 0, [self.path])
+
+    def export_json(self, path):
+        return jsonstream.rewrite(self.path, jsonstream.read_records(self.path), dest=path)
+
+
+class BinaryBackend(ReplicaBackend):
+    readonly = True
+
+    def __init__(self, base_path, readonly=True):
+        from common.binfmt import BinaryReplica
+        self.path = base_path + ".bin"
+        self.replica = BinaryReplica(self.path)
+
+    def get(self, item_id):
+        return self.replica.get(item_id)
+
+    def version(self, item_id):
+        return file_version(self.path)
+
+    def __iter__(self):
+        return iter(self.replica)
+
+    def __len__(self):
+        return len(self.replica)
+
+    def close(self):
+        self.replica.close()
+
+
+class SQLiteBackend(ReplicaBackend):
+    """One SQLite database per replica, with ID as the primary key.
+
+    Each thread gets its own connection; sqlite3 caches the prepared form of
+    the fixed statements below per connection. Inserting an ID that already
+    exists keeps the stored row, matching the first-match lookup of the other
+    backends; put() updates the row in place."""
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS inventory ("
+        "ID TEXT PRIMARY KEY, QTY INTEGER NOT NULL, Price INTEGER NOT NULL, Location TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS inventory_location ON inventory (Location)",
+    ]
+    SELECT_ONE = "SELECT ID, QTY, Price, Location FROM inventory WHERE ID = ?"
+    SELECT_ALL = "SELECT ID, QTY, Price, Location FROM inventory ORDER BY rowid"
+    SELECT_LOCATION = "SELECT ID, QTY, Price, Location FROM inventory WHERE Location = ? ORDER BY rowid"
+    INSERT = "INSERT INTO inventory (ID, QTY, Price, Location) VALUES (?, ?, ?, ?) ON CONFLICT(ID) DO NOTHING"
+    UPSERT = ("INSERT INTO inventory (ID, QTY, Price, Location) VALUES (?, ?, ?, ?) "
+              "ON CONFLICT(ID) DO UPDATE SET QTY = excluded.QTY, Price = excluded.Price, Location = excluded.Location")
+    DELETE = "DELETE FROM inventory WHERE ID = ?"
+
+    def __init__(self, base_path, readonly=False):
+        self.path = base_path + ".sqlite3"
+        self.readonly = readonly
+        self._local = threading.local()
+        self._merkle = None
+        self._merkle_lock = threading.Lock()
+        self._seeded = False
+        # Until a writer has created and seeded the database, a read-only
+        # opener serves the JSON replica it will be seeded from.
+        self._fallback = JSONBackend(base_path, readonly=True)
+        if readonly:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+        if conn.execute("SELECT COUNT(*) FROM inventory").fetchone()[0] == 0:
+            conn.executemany(self.INSERT, [self._row(r) for r in self._fallback])
+        conn.execute("COMMIT")
+        self._seeded = True
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _ready(self):
+        """True once the database exists and holds the seeded table."""
+        if self._seeded:
+            return True
+        if not os.path.exists(self.path):
+            return False
+        import sqlite3
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inventory'").fetchone()
+        except sqlite3.OperationalError:
+            self._local.conn = None
+            return False
+        # The writer creates the table and seeds it in one transaction, so an
+        # empty table here means an empty replica.
+        self._seeded = row is not None
+        return self._seeded
+
+    @staticmethod
+    def _row(record):
+        return (record["ID"], record["QTY"], record["Price"], record["Location"])
+
+    @staticmethod
+    def _record(row):
+        return {"ID": row[0], "QTY": row[1], "Price": row[2], "Location": row[3]}
+
+    def get(self, item_id):
+        if not self._ready():
+            return self._fallback.get(item_id)
+        row = self._conn().execute(self.SELECT_ONE, (item_id,)).fetchone()
+        return None if row is None else self._record(row)
+
+    def get_many(self, item_ids):
+        if not self._ready():
+            return self._fallback.get_many(item_ids)
+        conn = self._conn()
+        found = {}
+        for item_id in item_ids:
+            row = conn.execute(self.SELECT_ONE, (item_id,)).fetchone()
+            found[item_id] = None if row is None else self._record(row)
+        return found
+
+    def version(self, item_id):
+        # Every commit, from any process, changes the database or its WAL.
+        if not self._ready():
+            return self._fallback.version(item_id)
+        return (file_version(self.path), file_version(self.path + "-wal"))
+
+    def scan(self, predicate, location=None):
+        if not self._ready():
+            return self._fallback.scan(predicate, location)
+        if location is not None:
+            rows = self._conn().execute(self.SELECT_LOCATION, (location,))
+        else:
+            rows = self._conn().execute(self.SELECT_ALL)
+        return [record for record in map(self._record, rows) if predicate(record)]
+
+    def __iter__(self):
+        if not self._ready():
+            return iter(self._fallback)
+        return map(self._record, self._conn().execute(self.SELECT_ALL))
+
+    def __len__(self):
+        if not self._ready():
+            return len(self._fallback)
+        return self._conn().execute("SELECT COUNT(*) FROM inventory").fetchone()[0]
+
+    def begin(self):
+        if not self.readonly:
+            self._conn().execute("BEGIN IMMEDIATE")
+            self._local.in_txn = True
+
+    def commit(self):
+        if getattr(self._local, "in_txn", False):
+            self._conn().execute("COMMIT")
+            self._local.in_txn = False
+
+    def rollback(self):
+        if getattr(self._local, "in_txn", False):
+            self._conn().execute("ROLLBACK")
+            self._local.in_txn = False
+            self._merkle = None
+
+    def _write(self, fn):
+        if self.readonly:
+            raise PermissionError(f"{self.path} is open read-only")
+        own = not getattr(self._local, "in_txn", False)
+        if own:
+            self.begin()
+        try:
+            fn(self._conn())
+        except Exception:
+            if own:
+                self.rollback()
+            raise
+        if own:
+            self.commit()
+
+    def extend(self, records):
+        def write(conn):
+            for record in records:
+                if conn.execute(self.INSERT, self._row(record)).rowcount and self._merkle:
+                    self._merkle.add(record)
+        self._write(write)
+
+    def put(self, item_id, records):
+        def write(conn):
+            old = self.get(item_id)
+            if records:
+                conn.execute(self.UPSERT, self._row(records[0]))
+            else:
+                conn.execute(self.DELETE, (item_id,))
+            if self._merkle:
+                if old is not None:
+                    self._merkle.remove(old)
+                if records:
+                    self._merkle.add(records[0])
+        self._write(write)
+
+    def upsert(self, records):
+        def write(conn):
+            for record in records:
+                old = self.get(record["ID"]) if self._merkle else None
+                conn.execute(self.UPSERT, self._row(record))
+                if self._merkle:
+                    if old is not None:
+                        self._merkle.remove(old)
+                    self._merkle.add(record)
+        self._write(write)
+
+    @property
+    def merkle(self):
+        with self._merkle_lock:
+            if self._merkle is None:
+                self._merkle = BucketMerkleTree.build(self)
+            return self._merkle
+
+    def footprint(self):
+        if not self._ready():
+            return self._fallback.footprint()
+        # Rows live in the database; what stays resident is SQLite's page cache
+        # (bounded by cache_size, not by the replica) plus the Merkle tree once built.
+        footprint = _disk_footprint(len(self), 0, [self.path, self.path + "-wal"])
+        cache_size = self._conn().execute("PRAGMA cache_size").fetchone()[0]
+        page_size = self._conn().execute("PRAGMA page_size").fetchone()[0]
+        footprint["page_cache_bytes_max"] = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+        return footprint
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class CommitLogBackend(ReplicaBackend):
+    """A replica applied from the shared commit log (see common.commitlog).
+
+    Writes made through one replica are logged for that replica only; a
+    ReplicaSet commit logs the batch once for all four. Read-only replicas
+    follow the log at most once per refresh_interval."""
+
+    def __init__(self, base_path, readonly=False, log=None, letter=None, refresh_interval=1.0):
+        self.readonly = readonly
+        self.letter = letter
+        self.log = log
+        self.refresh_interval = refresh_interval
+        self.replica = CursorReplica(base_path, letter, log, readonly)
+        self._checked = time.monotonic()
+
+    @classmethod
+    def open_set(cls, data_dir, letters, readonly):
+        log = CommitLog(os.path.join(data_dir, "commitlog"), readonly=readonly)
+        return SharedLogReplicaSet(log, {letter: cls(replica_base(letter, data_dir), readonly, log, letter)
+                                         for letter in letters})
+
+    def catch_up(self):
+        self._checked = time.monotonic()
+        return self.replica.catch_up()
+
+    def _maybe_refresh(self):
+        if self.readonly and time.monotonic() - self._checked >= self.refresh_interval:
+            self.catch_up()
+
+    def get(self, item_id):
+        found = self.get_all(item_id)
+        return found[0] if found else None
+
+    def get_all(self, item_id):
+        self._maybe_refresh()
+        return self.replica.get_all(item_id)
+
+    def version(self, item_id):
+        self._maybe_refresh()
+        return self.replica.versions.get(item_id, 0)
+
+    def __iter__(self):
+        self._maybe_refresh()
+        return iter(self.replica)
+
+    def __len__(self):
+        return len(self.replica)
+
+    def _log(self, entry):
+        if self.readonly:
+            raise PermissionError(f"{self.replica.base_path} is open read-only")
+        self.log.append(dict(entry, replica=self.letter))
+        self.catch_up()
+
+    def extend(self, records):
+        self._log({"op": "add", "records": list(records)})
+
+    def put(self, item_id, records):
+        self._log({"op": "put", "id": item_id, "records": list(records)})
+
+    def upsert(self, records):
+        self._log({"op": "upsert", "records": list(records)})
+
+    @property
+    def merkle(self):
+        return self.replica.merkle
+
+    def footprint(self):
+        return self.replica.footprint()
+
+
+BACKENDS = {"log": LogBackend, "commitlog": CommitLogBackend, "sqlite": SQLiteBackend, "json": JSONBackend,
+            "binary": BinaryBackend}
+
+
+class ReplicaSet(dict):
+    """The four replicas of one backend, keyed by inventory letter."""
+
+    def commit(self, records):
+        """Upsert a batch into every replica, in one transaction per replica where supported."""
+        begun = []
+        try:
+            for replica in self.values():
+                replica.begin()
+                begun.append(replica)
+                replica.upsert(records)
+        except Exception:
+            for replica in begun:
+                replica.rollback()
+            raise
+        for replica in begun:
+            replica.commit()
+
+    def lookup(self, letter, item_id):
+        return self[letter.upper()].get(item_id)
+
+    def get_many(self, letter, item_ids):
+        return self[letter.upper()].get_many(item_ids)
+
+    def versions(self, item_id):
+        """Version vector for one item: its version in each replica, in letter order."""
+        return tuple(self[letter].version(item_id) for letter in sorted(self))
+
+    def scan(self, letter, predicate, location=None):
+        return self[letter.upper()].scan(predicate, location)
+
+    def footprint(self):
+        return {letter: replica.footprint() for letter, replica in self.items()}
+
+    def close(self):
+        for replica in self.values():
+            replica.close()
+
+
+class SharedLogReplicaSet(ReplicaSet):
+    """Replicas fed from one commit log: a commit is one log append, after
+    which each replica applies it from its own cursor."""
+
+    def __init__(self, log, replicas):
+        super().__init__(replicas)
+        self.log = log
+        self._pruned = 0
+
+    def commit(self, records):
+        self.log.append({"op": "upsert", "records": list(records)})
+        for replica in self.values():
+            replica.catch_up()
+        applied = min(replica.replica.checkpointed for replica in self.values())
+        if applied > self._pruned:
+            self.log.prune(applied)
+            self._pruned = applied
+
+    def close(self):
+        super().close()
+        self.log.close()
+
+
+def open_replicas(backend=None, readonly=False, letters="ABCD", data_dir=DATA_DIR):
+    return BACKENDS[backend or BACKEND].open_set(data_dir, letters, readonly)
@@ -0,0 +1,138 @@
+"""Fixed-width binary inventory replicas, read in place through mmap.
+
+    python -m common.binfmt to-bin DATA/inventory_a.json DATA/inventory_a.bin
+    python -m common.binfmt to-json DATA/inventory_a.bin DATA/inventory_a.json
+
+Layout: header | count fixed-width records in replica order | count index
+entries (ID, record number) sorted by ID, so a lookup is a binary search over
+the index and a scan walks the records, neither deserialising the whole file.
+"""
+import argparse
+import mmap
+import os
+import struct
+
+from common.atomicfile import atomic_open
+from common.jsonstream import read_records, rewrite
+
+MAGIC = b"INVBIN1\0"
+HEADER = struct.Struct(">8sIIQQ")
+ID_SIZE = 16
+LOCATION_SIZE = 4
+RECORD = struct.Struct(">16sqq4s")
+INDEX = struct.Struct(">16sI")
+VERSION = 1
+
+
+def _pack_text(value, size, field):
+    raw = str(value).encode()
+    if len(raw) > size:
+        raise ValueError(f"{field} {value!r} is longer than {size} bytes")
+    return raw
+
+
+def _unpack_text(raw):
+    return raw.rstrip(b"\0").decode()
+
+
+def write_binary(records, path):
+    """Write an iterable of {"ID","QTY","Price","Location"} dicts; returns the count."""
+    keys = []
+    with atomic_open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0, 0))
+        for recno, record in enumerate(records):
+            item_id = _pack_text(record["ID"], ID_SIZE, "ID")
+            f.write(RECORD.pack(item_id, int(record["QTY"]), int(record["Price"]),
+                                _pack_text(record["Location"], LOCATION_SIZE, "Location")))
+            keys.append((item_id.ljust(ID_SIZE, b"\0"), recno))
+        index_offset = f.tell()
+        keys.sort()
+        for item_id, recno in keys:
+            f.write(INDEX.pack(item_id, recno))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(keys), index_offset))
+    return len(keys)
+
+
+class BinaryReplica:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size < HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a binary inventory")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.count, self.index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{path} is not a version {VERSION} binary inventory")
+
+    def record(self, recno):
+        item_id, qty, price, location = RECORD.unpack_from(self._map, HEADER.size + recno * RECORD.size)
+        return {"ID": _unpack_text(item_id), "QTY": qty, "Price": price, "Location": _unpack_text(location)}
+
+    def _index_id(self, pos):
+        return self._map[self.index_offset + pos * INDEX.size:self.index_offset + pos * INDEX.size + ID_SIZE]
+
+    def get(self, item_id):
+        """First record with this ID, like a linear scan would find."""
+        try:
+            key = _pack_text(item_id, ID_SIZE, "ID").ljust(ID_SIZE, b"\0")
+        except ValueError:
+            return None
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._index_id(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._index_id(lo) == key:
+            _, recno = INDEX.unpack_from(self._map, self.index_offset + lo * INDEX.size)
+            return self.record(recno)
+        return None
+
+    def __iter__(self):
+        for recno in range(self.count):
+            yield self.record(recno)
+
+    def scan(self, predicate):
+        return (record for record in self if predicate(record))
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def json_to_binary(json_path, bin_path):
+    return write_binary(read_records(json_path), bin_path)
+
+
+def binary_to_json(bin_path, json_path):
+    with BinaryReplica(bin_path) as replica:
+        rewrite(json_path, iter(replica))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["to-bin", "to-json"])
+    parser.add_argument("source")
+    parser.add_argument("dest")
+    args = parser.parse_args(argv)
+    if args.command == "to-bin":
+        print(f"wrote {json_to_binary(args.source, args.dest)} records to {args.dest}")
+    else:
+        binary_to_json(args.source, args.dest)
+        print(f"wrote {args.dest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from common.merkle import leaf_hash, merkle_proof, merkle_root, verify_proof
+from common.signatures import cached_verify, find_invalid_signatures, sign_message
+from common.txlog import HEADER, LOG_MAGIC, encode_entry, read_entries, read_log_header
+
+GENESIS_HASH = "0" * 64
+
+log = logging.getLogger(__name__)
+
+
+def header_message(header):
+    return json.dumps(header, sort_keys=True, separators=(",", ":"))
+
+
+def header_hash(header):
+    return hashlib.sha256(header_message(header).encode()).hexdigest()
+
+
+def verify_block(header, signature, records, public_key):
+    """One verifier's check: the records match the root, and the header is signed."""
+    if merkle_root([leaf_hash(r) for r in records]).hex() != header["merkle_root"]:
+        return False
+    return cached_verify(header_message(header), signature, public_key)
+
+
+class BlockChain:
+    """Accepted blocks, persisted to an append-only log.
+
+    Per-record leaf hashes stay in memory so inclusion proofs can be served
+    for any committed item without re-reading the chain."""
+
+    def __init__(self, path):
+        self.path = path
+        self.headers = []
+        self.signatures = []
+        self.leaves = []
+        self.locations = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            with open(path, "rb") as f:
+                read_log_header(f)
+                end = HEADER.size
+                for entry, end in read_entries(f):
+                    self._index(entry["header"], entry["signature"], entry["records"])
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        else:
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(LOG_MAGIC, 0))
+        self._log = open(path, "ab")
+
+    def _index(self, header, signature, records):
+        height = len(self.headers)
+        self.headers.append(header)
+        self.signatures.append(signature)
+        self.leaves.append([leaf_hash(r) for r in records])
+        for i, record in enumerate(records):
+            self.locations[record["ID"]] = (height, i, record)
+
+    @property
+    def tip(self):
+        return header_hash(self.headers[-1]) if self.headers else GENESIS_HASH
+
+    def next_header(self, proposer, records, key_fp=None):
+        return {
+            "key": key_fp,
+            "height": len(self.headers),
+            "prev_hash": self.tip,
+            "merkle_root": merkle_root([leaf_hash(r) for r in records]).hex(),
+            "count": len(records),
+            "timestamp": time.time(),
+            "proposer": proposer,
+        }
+
+    def append(self, header, signature, records):
+        with self._lock:
+            if header["prev_hash"] != self.tip or header["height"] != len(self.headers):
+                raise ValueError("block does not extend the current tip")
+            self._log.write(encode_entry({"header": header, "signature": signature, "records": records}))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._index(header, signature, records)
+
+    def proof(self, item_id):
+        location = self.locations.get(item_id)
+        if location is None:
+            return None
+        height, index, record = location
+        header = self.headers[height]
+        proof = merkle_proof(self.leaves[height], index)
+        return {
+            "record": record,
+            "header": header,
+            "block_hash": header_hash(header),
+            "index": index,
+            "proof": proof,
+            "verified": verify_proof(leaf_hash(record), proof, bytes.fromhex(header["merkle_root"])),
+        }
+
+    def audit(self, keyring):
+        """Check the hash links, then the header signatures in one batch per signing key."""
+        broken = [h for h in range(1, len(self.headers))
+                  if self.headers[h]["prev_hash"] != header_hash(self.headers[h - 1])]
+        by_key = {}
+        for height, header in enumerate(self.headers):
+            key = keyring.by_fingerprint(header.get("key")) or keyring[header["proposer"]]
+            by_key.setdefault(key.public_key, []).append(height)
+        bad_signatures = []
+        for public_key, heights in by_key.items():
+            msgs = [header_message(self.headers[h]) for h in heights]
+            sigs = [self.signatures[h] for h in heights]
+            bad_signatures += [heights[i] for i in find_invalid_signatures(msgs, sigs, public_key)]
+        return {"blocks": len(self.headers), "broken_links": broken, "bad_signatures": sorted(bad_signatures)}
+
+
+class BlockProducer:
+    """Groups records per proposer into signed blocks.
+
+    A block is sealed when it reaches max_size records or its oldest record
+    has waited max_wait seconds. The proposer signs only the header, the
+    verifiers each check that one signature, and on quorum the records are
+    handed to `commit` and the block is appended to the chain.
+
+    Records queued by submit() have already been acknowledged, so a batch
+    whose commit raises goes back on the queue to be retried, and a batch
+    the verifiers reject is counted in status() rather than dropped silently.
+    A record submitted with an idempotency key claimed in `idempotency` has
+    the key confirmed once its block commits, or released if it is rejected."""
+
+    def __init__(self, keyring, chain, consensus, commit, max_size=500, max_wait=2.0, idempotency=None):
+        self.keyring = keyring
+        self.chain = chain
+        self.consensus = consensus
+        self.commit = commit
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.idempotency = idempotency
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._seal_lock = threading.Lock()
+        self._timer = None
+        self._stats = {"blocks": 0, "rejected_records": 0, "failed_attempts": 0, "last_error": None}
+
+    def propose_block(self, proposer, records):
+        key = self.keyring[proposer]
+        with self._seal_lock:
+            header = self.chain.next_header(proposer, records, key.fingerprint)
+            signature = sign_message(header_message(header), key)
+            round_result = self.consensus.run({
+                node: (verify_block, (header, signature, records, key.public_key)) for node in self.keyring
+            })
+            if round_result.accepted:
+                # Commit first: the writes are upserts, so a block whose commit
+                # failed can be proposed again, but a chained block cannot be undone.
+                self.commit(records)
+                self.chain.append(header, signature, records)
+        return header, round_result
+
+    def propose_many(self, proposer, records):
+        return [self.propose_block(proposer, records[i:i + self.max_size])
+                for i in range(0, len(records), self.max_size)]
+
+    def submit(self, proposer, record, key=None):
+        with self._lock:
+            pending = self._pending.setdefault(proposer, {"since": time.monotonic(), "records": [], "keys": []})
+            pending["records"].append(record)
+            pending["keys"].append(key)
+            full = len(pending["records"]) >= self.max_size
+            if full:
+                del self._pending[proposer]
+            self._ensure_timer()
+        if full:
+            self._propose_queued(proposer, pending)
+
+    def _propose_queued(self, proposer, batch):
+        """Propose an acknowledged batch, re-queueing whatever could not be committed."""
+        results = []
+        records, keys = batch["records"], batch["keys"]
+        for i in range(0, len(records), self.max_size):
+            try:
+                header, round_result = self.propose_block(proposer, records[i:i + self.max_size])
+            except Exception as exc:
+                log.exception("block from %s failed; re-queueing %d records", proposer, len(records) - i)
+                self._requeue(proposer, batch["since"], records[i:], keys[i:])
+                with self._lock:
+                    self._stats["failed_attempts"] += 1
+                    self._stats["last_error"] = f"{type(exc).__name__}: {exc}"
+                break
+            if self.idempotency is not None:
+                settle = self.idempotency.confirm if round_result.accepted else self.idempotency.release
+                for key in keys[i:i + self.max_size]:
+                    if key is not None:
+                        settle(key)
+            with self._lock:
+                if round_result.accepted:
+                    self._stats["blocks"] += 1
+                else:
+                    log.warning("block %d from %s rejected; %d records not committed",
+                                header["height"], proposer, header["count"])
+                    self._stats["rejected_records"] += header["count"]
+            results.append((header, round_result))
+        return results
+
+    def _requeue(self, proposer, since, records, keys):
+        with self._lock:
+            pending = self._pending.get(proposer)
+            if pending is None:
+                self._pending[proposer] = {"since": since, "records": list(records), "keys": list(keys)}
+            else:
+                pending["since"] = min(since, pending["since"])
+                pending["records"][:0] = records
+                pending["keys"][:0] = keys
+
+    def pending(self):
+        with self._lock:
+            return sum(len(p["records"]) for p in self._pending.values())
+
+    def status(self):
+        with self._lock:
+            return dict(self._stats, pending=sum(len(p["records"]) for p in self._pending.values()))
+
+    def flush(self, older_than=0.0):
+        now = time.monotonic()
+        with self._lock:
+            due = {node: p for node, p in self._pending.items() if now - p["since"] >= older_than}
+            for node in due:
+                del self._pending[node]
+        results = []
+        for node, p in due.items():
+            results += self._propose_queued(node, p)
+        return results
+
+    def _ensure_timer(self):
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Thread(target=self._run_timer, name="block-producer", daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(min(self.max_wait / 4, 0.5))
+            try:
+                self.flush(older_than=self.max_wait)
+            except Exception:
+                log.exception("block producer flush failed")
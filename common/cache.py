@@ -0,0 +1,134 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(":".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class VerificationCache(LRUCache):
+    """Remembers verify outcomes by (key fingerprint, message digest, signature).
+
+    Concurrent callers asking about the same key while it is being checked
+    wait for that one check instead of repeating it."""
+
+    def __init__(self, maxsize=1024):
+        super().__init__(maxsize)
+        self._pending = {}
+
+    def verify(self, key_fp, digest, signature, check):
+        key = (key_fp, digest, signature)
+        result = self.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+        with self._lock:
+            event = self._pending.get(key)
+            owner = event is None
+            if owner:
+                event = self._pending[key] = threading.Event()
+        if not owner:
+            event.wait()
+            result = self.get(key, _MISSING)
+            return bool(check()) if result is _MISSING else result
+        try:
+            result = bool(check())
+            self.put(key, result)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+        return result
+
+
+class VersionedCache(LRUCache):
+    """LRU entries that also expire after ttl seconds and are only returned
+    while the caller's version for the key still matches the stored one.
+
+    A version mismatch drops that one entry, so a change to an item
+    invalidates exactly its own cached result."""
+
+    def __init__(self, maxsize=1024, ttl=30.0):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.expired = 0
+        self.invalidated = 0
+
+    def lookup(self, key, version, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                stored_version, expires, value = entry
+                if stored_version == version and now < expires:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                if stored_version != version:
+                    self.invalidated += 1
+                else:
+                    self.expired += 1
+            self.misses += 1
+            return default
+
+    def store(self, key, version, value):
+        self.put(key, (version, time.monotonic() + self.ttl, value))
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self.expired = self.invalidated = 0
+
+    def stats(self):
+        return dict(super().stats(), ttl=self.ttl, expired=self.expired, invalidated=self.invalidated)
+
+
+VERIFY_CACHE = VerificationCache(maxsize=4096)
@@ -0,0 +1,327 @@
+"""One durable commit log shared by all four replicas.
+
+part1 appends each committed batch once, as a numbered entry. Every replica
+applies entries in order and remembers the last sequence number applied (its
+cursor) in its checkpoint, so after a restart or a lag it replays only the
+entries past its cursor. The log is split into segments named by their first
+sequence number; segments every replica has checkpointed past are deleted.
+
+Entries are {"seq", "op": "upsert", "records"} for commits. "add" (append
+without replacing) and "put" (replace everything under one ID) exist for
+repairs and one-off tools; any entry carrying "replica" is applied only by
+that replica.
+
+Only one process may append: the writer holds an exclusive lock on
+<directory>/writer.lock for as long as the log is open, and a second writer
+fails at open instead of interleaving sequence numbers with the first.
+"""
+import json
+import os
+import struct
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on this platform; the single-writer rule is then up to the caller.
+    fcntl = None
+
+from common.atomicfile import write_atomic
+from common.merkle import BucketMerkleTree
+from common.txlog import ReplicaLog, encode_entry, read_entries
+
+SEGMENT_MAGIC = b"INVCLOG1"
+SEGMENT_HEADER = struct.Struct(">8sQ")
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+class CommitLogGap(Exception):
+    """The entries a replica needs next have already been pruned."""
+
+
+class CommitLogLocked(Exception):
+    """Another process already has the commit log open for writing."""
+
+
+class CommitLog:
+    def __init__(self, directory, readonly=False, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.readonly = readonly
+        self.segment_bytes = segment_bytes
+        self.last_seq = 0
+        self._file = None
+        self._writer_lock = None
+        self._lock = threading.Lock()
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+            self._lock_writer()
+            self._open_tail()
+
+    def _lock_writer(self):
+        path = os.path.join(self.directory, "writer.lock")
+        f = open(path, "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                raise CommitLogLocked(f"{self.directory} is already open for writing by another process")
+        self._writer_lock = f
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f"{first_seq:016d}.seg")
+
+    def segments(self):
+        """First sequence numbers of the segments on disk, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-4]) for name in names if name.endswith(".seg") and name[:-4].isdigit())
+
+    def first_seq(self):
+        segments = self.segments()
+        return segments[0] if segments else self.last_seq + 1
+
+    def _open_tail(self):
+        segments = self.segments()
+        if not segments:
+            self._start_segment(1)
+            return
+        path = self._segment_path(segments[-1])
+        end, last = SEGMENT_HEADER.size, segments[-1] - 1
+        with open(path, "rb") as f:
+            _read_header(f)
+            for entry, offset in read_entries(f):
+                end, last = offset, entry["seq"]
+        # Drop any torn tail left by a crash before appending after it.
+        with open(path, "r+b") as f:
+            f.truncate(end)
+        self.last_seq = last
+        self._file = open(path, "ab")
+
+    def _start_segment(self, first_seq):
+        if self._file:
+            self._file.close()
+        path = self._segment_path(first_seq)
+        write_atomic(path, SEGMENT_HEADER.pack(SEGMENT_MAGIC, first_seq))
+        self._file = open(path, "ab")
+
+    def append(self, entry):
+        """Durably append one entry and return its sequence number."""
+        if self.readonly:
+            raise PermissionError(f"{self.directory} is open read-only")
+        with self._lock:
+            if self._file.tell() >= self.segment_bytes:
+                self._start_segment(self.last_seq + 1)
+            seq = self.last_seq + 1
+            self._file.write(encode_entry(dict(entry, seq=seq)))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.last_seq = seq
+            return seq
+
+    def read_from(self, seq, position=None):
+        """Yield (entry, position) for every entry numbered seq or later.
+
+        position is (segment, offset) just past the yielded entry; passing the
+        last one back resumes without rescanning the segment."""
+        segments = self.segments()
+        if not segments or seq < segments[0]:
+            if segments or seq <= self.last_seq:
+                raise CommitLogGap(f"entry {seq} is no longer in {self.directory}")
+            return
+        start = max(i for i, first in enumerate(segments) if first <= seq)
+        for first in segments[start:]:
+            try:
+                f = open(self._segment_path(first), "rb")
+            except FileNotFoundError:
+                raise CommitLogGap(f"segment {first} was pruned while being read")
+            with f:
+                if position is not None and position[0] == first:
+                    f.seek(position[1])
+                else:
+                    _read_header(f)
+                for entry, offset in read_entries(f):
+                    if entry["seq"] >= seq:
+                        yield entry, (first, offset)
+
+    def prune(self, applied_seq):
+        """Delete segments whose entries are all at or below applied_seq."""
+        segments = self.segments()
+        removed = 0
+        for first, following in zip(segments, segments[1:]):
+            if following - 1 > applied_seq:
+                break
+            os.remove(self._segment_path(first))
+            removed += 1
+        return removed
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._writer_lock:
+            # Closing the file releases the flock.
+            self._writer_lock.close()
+            self._writer_lock = None
+
+
+def _read_header(f):
+    raw = f.read(SEGMENT_HEADER.size)
+    if len(raw) < SEGMENT_HEADER.size or raw[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+        raise ValueError(f"{f.name} is not a commit log segment")
+    return SEGMENT_HEADER.unpack(raw)[1]
+
+
+class CursorReplica:
+    """One replica materialised from the shared log, up to its cursor.
+
+    The checkpoint (<base>.applied.json) holds the records and the cursor they
+    reflect. Like ReplicaLog's snapshot, it is rewritten only once the records
+    applied since the last one number as many as the replica holds (and at
+    least checkpoint_every), so its cost per commit stays flat as the replica
+    grows. A replica with no checkpoint starts at cursor 0 from its existing
+    files."""
+
+    def __init__(self, base_path, letter, log, readonly=False, checkpoint_every=1000):
+        self.base_path = base_path
+        self.letter = letter
+        self.log = log
+        self.readonly = readonly
+        self.checkpoint_path = base_path + ".applied.json"
+        self.checkpoint_every = checkpoint_every
+        self.versions = {}
+        self.count = 0
+        self.since_checkpoint = 0
+        self._merkle = None
+        self._lock = threading.RLock()
+        self._load_checkpoint()
+        if not readonly and not os.path.exists(self.checkpoint_path):
+            self.checkpoint()
+        self.catch_up()
+
+    def _load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            cursor, records = checkpoint["cursor"], checkpoint["records"]
+        else:
+            # First start: take over what the per-replica log store (or, failing
+            # that, the legacy JSON file) holds.
+            cursor, records = 0, ReplicaLog(self.base_path, readonly=True)
+        old = getattr(self, "items", {})
+        self.items = {}
+        self.count = 0
+        for record in records:
+            self.items.setdefault(record["ID"], []).append(record)
+            self.count += 1
+        for item_id in old.keys() | self.items.keys():
+            if old.get(item_id) != self.items.get(item_id):
+                self._bump(item_id)
+        self.cursor = self.checkpointed = cursor
+        self.since_checkpoint = 0
+        self.position = None
+        self._merkle = None
+
+    def _bump(self, item_id):
+        self.versions[item_id] = self.versions.get(item_id, 0) + 1
+
+    def _put(self, item_id, records):
+        old = self.items.get(item_id, [])
+        if old == records:
+            return
+        if self._merkle:
+            for record in old:
+                self._merkle.remove(record)
+            for record in records:
+                self._merkle.add(record)
+        if records:
+            self.items[item_id] = list(records)
+        else:
+            self.items.pop(item_id, None)
+        self.count += len(records) - len(old)
+        self._bump(item_id)
+
+    def _apply(self, entry):
+        if entry.get("replica") not in (None, self.letter):
+            return
+        self.since_checkpoint += len(entry["records"])
+        if entry["op"] == "upsert":
+            for record in entry["records"]:
+                self._put(record["ID"], [record])
+        elif entry["op"] == "add":
+            for record in entry["records"]:
+                self._put(record["ID"], self.items.get(record["ID"], []) + [record])
+        elif entry["op"] == "put":
+            self._put(entry["id"], entry["records"])
+        else:
+            raise ValueError(f"unknown commit log op {entry['op']!r}")
+
+    def catch_up(self):
+        """Apply every entry past the cursor; returns how many were applied."""
+        with self._lock:
+            applied = 0
+            try:
+                applied = self._replay()
+            except CommitLogGap:
+                # Lagged past pruning: the checkpoint written since covers the gap.
+                self._load_checkpoint()
+                try:
+                    applied = self._replay()
+                except CommitLogGap:
+                    raise CommitLogGap(f"{self.checkpoint_path} is older than the pruned log; "
+                                       "seed it from another replica's checkpoint")
+            if not self.readonly and self.since_checkpoint >= max(self.checkpoint_every, self.count):
+                self.checkpoint()
+            return applied
+
+    def _replay(self):
+        applied = 0
+        for entry, position in self.log.read_from(self.cursor + 1, self.position):
+            self._apply(entry)
+            self.cursor, self.position = entry["seq"], position
+            applied += 1
+        return applied
+
+    def checkpoint(self):
+        with self._lock:
+            records = [record for records in self.items.values() for record in records]
+            data = json.dumps({"cursor": self.cursor, "records": records}, separators=(",", ":")).encode()
+            write_atomic(self.checkpoint_path, data)
+            self.checkpointed = self.cursor
+            self.since_checkpoint = 0
+
+    def get_all(self, item_id):
+        return list(self.items.get(item_id, []))
+
+    @property
+    def merkle(self):
+        with self._lock:
+            if self._merkle is None:
+                self._merkle = BucketMerkleTree.build(self)
+            return self._merkle
+
+    def __iter__(self):
+        with self._lock:
+            groups = list(self.items.values())
+        return (record for records in groups for record in records)
+
+    def __len__(self):
+        return self.count
+
+    def footprint(self):
+        with self._lock:
+            groups = list(self.items.items())
+        size = sys.getsizeof(self.items) + sys.getsizeof(self.versions)
+        for item_id, records in groups:
+            size += sys.getsizeof(item_id) + sys.getsizeof(records)
+            for record in records:
+                size += sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record.values())
+        per_record = size / self.count if self.count else 0
+        return {
+            "indexed_ids": len(groups),
+            "bytes": size,
+            "bytes_per_million": int(per_record * 1_000_000),
+        }
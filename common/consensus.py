@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
+
+ACCEPTED = "Accepted"
+REJECTED = "Rejected"
+TIMED_OUT = "Timed out"
+NOT_NEEDED = "Not needed"
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(kind="thread", max_workers=None):
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            if kind == "process":
+                # multiprocessing is only imported by deployments that ask for it.
+                from concurrent.futures import ProcessPoolExecutor
+                pool = ProcessPoolExecutor(max_workers=max_workers)
+            elif kind == "thread":
+                pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verifier")
+            else:
+                raise ValueError(f"unknown executor {kind!r}")
+            _pools[kind] = pool
+        return pool
+
+
+class ConsensusResult:
+    def __init__(self, accepted, verdicts, accepts, rejects, elapsed):
+        self.accepted = accepted
+        self.verdicts = verdicts
+        self.accepts = accepts
+        self.rejects = rejects
+        self.elapsed = elapsed
+
+
+class ConsensusEngine:
+    """Runs one verifier per node concurrently and stops at a certain outcome.
+
+    The round is accepted once `quorum` verifiers accept and rejected once so
+    many have rejected (or failed, or timed out) that the quorum is out of
+    reach. Verifiers still running at that point are cancelled or ignored."""
+
+    def __init__(self, quorum=3, timeout=2.0, executor="thread", max_workers=None):
+        self.quorum = quorum
+        self.timeout = timeout
+        self.executor = executor
+        self.max_workers = max_workers
+
+    def run(self, tasks):
+        """tasks maps node -> (callable, args); the callable returns a bool."""
+        start = monotonic()
+        pool = get_pool(self.executor, self.max_workers)
+        futures = {pool.submit(fn, *args): node for node, (fn, args) in tasks.items()}
+        verdicts = {node: NOT_NEEDED for node in tasks}
+        reject_limit = len(tasks) - self.quorum + 1
+        accepts = rejects = 0
+        pending = set(futures)
+        deadline = None if self.timeout is None else start + self.timeout
+
+        while pending and accepts < self.quorum and rejects < reject_limit:
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = futures[future]
+                try:
+                    ok = bool(future.result())
+                except Exception:
+                    ok = False
+                verdicts[node] = ACCEPTED if ok else REJECTED
+                if ok:
+                    accepts += 1
+                else:
+                    rejects += 1
+
+        decided = accepts >= self.quorum or rejects >= reject_limit
+        for future in pending:
+            future.cancel()
+            if not decided:
+                verdicts[futures[future]] = TIMED_OUT
+        return ConsensusResult(accepts >= self.quorum, verdicts, accepts, rejects, monotonic() - start)
@@ -0,0 +1,50 @@
+"""One-shot compaction of duplicate item IDs left by the old append-only writes.
+
+    python -m common.dedupe [--dry-run] [--backend json] [DATA_DIR]
+
+Each duplicated ID keeps the position of its first row and the values of its
+last, the state a client would have seen had the writes been upserts. Run it
+while part1 is stopped.
+"""
+import argparse
+import json
+
+from common.backends import BACKEND, open_replicas
+from common.txlog import DATA_DIR
+
+
+def duplicates(records):
+    """{item_id: last record} for every ID stored more than once."""
+    latest, counts = {}, {}
+    for record in records:
+        latest[record["ID"]] = record
+        counts[record["ID"]] = counts.get(record["ID"], 0) + 1
+    return {item_id: latest[item_id] for item_id, count in counts.items() if count > 1}
+
+
+def dedupe(replicas, dry_run=False):
+    report = {}
+    for letter, replica in replicas.items():
+        found = duplicates(replica)
+        report[letter] = {"records": len(replica), "duplicated_ids": sorted(found)}
+        if found and not dry_run:
+            replica.upsert(list(found.values()))
+            report[letter]["records_after"] = len(replica)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    parser.add_argument("--backend", default=BACKEND)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    replicas = open_replicas(args.backend, data_dir=args.data_dir)
+    try:
+        print(json.dumps(dedupe(replicas, args.dry_run), indent=2))
+    finally:
+        replicas.close()
+
+
+if __name__ == "__main__":
+    main()
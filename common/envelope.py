@@ -0,0 +1,134 @@
+"""Hybrid (envelope) encryption for payloads larger than the RSA modulus.
+
+A random 32-byte session key is RSA-encrypted once. The payload is split into
+frames, each XORed with a SHA-256 counter-mode keystream and authenticated
+with HMAC-SHA256 over (nonce, frame number, final flag, ciphertext), so frames
+can be produced and checked one at a time and truncation is detected.
+
+Layout: b"ENV1" | u16 key length | wrapped key | 16-byte nonce |
+        frames of (u32 length with the top bit marking the last frame,
+        ciphertext, 32-byte tag)
+"""
+import hashlib
+import hmac
+import io
+import secrets
+import struct
+
+from common.keys import RSAKey
+
+MAGIC = b"ENV1"
+NONCE_SIZE = 16
+TAG_SIZE = 32
+CHUNK_SIZE = 64 * 1024
+FINAL = 0x80000000
+FRAME = struct.Struct(">I")
+
+
+def _session_keys(session_key):
+    return hashlib.sha256(b"enc" + session_key).digest(), hashlib.sha256(b"mac" + session_key).digest()
+
+
+def _keystream(enc_key, nonce, frame, length):
+    prefix = enc_key + nonce + frame.to_bytes(8, "big")
+    blocks = (length + 31) // 32
+    return b"".join(hashlib.sha256(prefix + i.to_bytes(8, "big")).digest() for i in range(blocks))[:length]
+
+
+def _xor(data, stream):
+    return (int.from_bytes(data, "big") ^ int.from_bytes(stream, "big")).to_bytes(len(data), "big")
+
+
+def _tag(mac_key, nonce, frame, final, ciphertext):
+    header = nonce + frame.to_bytes(8, "big") + (b"\x01" if final else b"\x00")
+    return hmac.new(mac_key, header + ciphertext, hashlib.sha256).digest()
+
+
+def _private_op(private_key, c):
+    if isinstance(private_key, RSAKey):
+        return private_key.private_op(c)
+    d, n = private_key
+    return pow(c, d, n)
+
+
+def iter_encrypt(chunks, public_key):
+    """Encrypt an iterable of byte chunks, yielding the envelope piece by piece."""
+    e, n = public_key
+    session_key = secrets.token_bytes(32)
+    if int.from_bytes(session_key, "big") >= n:
+        raise ValueError("RSA modulus too small to wrap a 256-bit session key")
+    wrapped = pow(int.from_bytes(session_key, "big"), e, n).to_bytes((n.bit_length() + 7) // 8, "big")
+    nonce = secrets.token_bytes(NONCE_SIZE)
+    enc_key, mac_key = _session_keys(session_key)
+    yield MAGIC + struct.pack(">H", len(wrapped)) + wrapped + nonce
+
+    frame = 0
+    pending = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if pending is not None:
+            yield _seal(enc_key, mac_key, nonce, frame, pending, final=False)
+            frame += 1
+        pending = chunk
+    yield _seal(enc_key, mac_key, nonce, frame, pending or b"", final=True)
+
+
+def _seal(enc_key, mac_key, nonce, frame, plaintext, final):
+    if len(plaintext) >= FINAL:
+        raise ValueError("frame too large")
+    ciphertext = _xor(plaintext, _keystream(enc_key, nonce, frame, len(plaintext)))
+    length = len(ciphertext) | (FINAL if final else 0)
+    return FRAME.pack(length) + ciphertext + _tag(mac_key, nonce, frame, final, ciphertext)
+
+
+def _read_exact(src, size):
+    data = src.read(size)
+    if len(data) != size:
+        raise ValueError("envelope is truncated")
+    return data
+
+
+def iter_decrypt(src, private_key):
+    """Yield plaintext frames from a readable envelope, each only after its tag checks out."""
+    if _read_exact(src, len(MAGIC)) != MAGIC:
+        raise ValueError("not an envelope")
+    (key_len,) = struct.unpack(">H", _read_exact(src, 2))
+    wrapped = int.from_bytes(_read_exact(src, key_len), "big")
+    try:
+        session_key = _private_op(private_key, wrapped).to_bytes(32, "big")
+    except OverflowError:
+        raise ValueError("session key does not unwrap under this private key")
+    nonce = _read_exact(src, NONCE_SIZE)
+    enc_key, mac_key = _session_keys(session_key)
+
+    frame = 0
+    while True:
+        (length,) = FRAME.unpack(_read_exact(src, FRAME.size))
+        final = bool(length & FINAL)
+        ciphertext = _read_exact(src, length & ~FINAL)
+        tag = _read_exact(src, TAG_SIZE)
+        if not hmac.compare_digest(tag, _tag(mac_key, nonce, frame, final, ciphertext)):
+            raise ValueError("envelope authentication failed")
+        yield _xor(ciphertext, _keystream(enc_key, nonce, frame, len(ciphertext)))
+        if final:
+            return
+        frame += 1
+
+
+def encrypt_stream(src, dst, public_key, chunk_size=CHUNK_SIZE):
+    for piece in iter_encrypt(iter(lambda: src.read(chunk_size), b""), public_key):
+        dst.write(piece)
+
+
+def decrypt_stream(src, dst, private_key):
+    for piece in iter_decrypt(src, private_key):
+        dst.write(piece)
+
+
+def encrypt_envelope(data, public_key, chunk_size=CHUNK_SIZE):
+    return b"".join(iter_encrypt((data[i:i + chunk_size] for i in range(0, len(data), chunk_size)), public_key))
+
+
+def decrypt_envelope(blob, private_key):
+    return b"".join(iter_decrypt(io.BytesIO(blob), private_key))
@@ -0,0 +1,38 @@
+"""Write each replica's current records to DATA/inventory_<x>.json.
+
+    python -m common.export [--backend commitlog] [DATA_DIR]
+
+Only the json backend writes those files as it goes; with the others they
+keep whatever they held when the backend first took them over. This opens the
+replicas read-only, so it can run next to part1, and rewrites each JSON file
+atomically from the backend's view.
+"""
+import argparse
+import json
+
+from common.backends import BACKEND, open_replicas
+from common.txlog import DATA_DIR, replica_base
+
+
+def export(replicas, data_dir=DATA_DIR):
+    report = {}
+    for letter, replica in replicas.items():
+        path = replica_base(letter, data_dir) + ".json"
+        report[letter] = {"records": replica.export_json(path), "path": path}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir", nargs="?", default=DATA_DIR)
+    parser.add_argument("--backend", default=BACKEND)
+    args = parser.parse_args(argv)
+    replicas = open_replicas(args.backend, readonly=True, data_dir=args.data_dir)
+    try:
+        print(json.dumps(export(replicas, args.data_dir), indent=2))
+    finally:
+        replicas.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Idempotency keys for submissions.
+
+The client sends a token with each submission (the part1 form carries a fresh
+one in a hidden field, the JSON routes take an Idempotency-Key header), and
+the key is the SHA-256 of that token. Retrying the same submission, e.g. a
+resent form, finds its key already committed and writes nothing; a new
+submission of the same values has a new token and goes through.
+
+Keys are appended to a log, one "key timestamp" line each, that is read back
+at startup. Keys expire after ttl seconds, and the log is rewritten without
+the expired ones once they make up most of it.
+"""
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from common.atomicfile import write_atomic
+
+KEYS_LOG = os.path.join("DATA", "idempotency.log")
+KEY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", 24 * 3600))
+
+
+def new_token():
+    return secrets.token_hex(16)
+
+
+def idempotency_key(token):
+    return hashlib.sha256(str(token).encode()).hexdigest()
+
+
+class IdempotencyLog:
+    def __init__(self, path=KEYS_LOG, ttl=KEY_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._committed = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._lines = 0
+        now = time.time()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    parts = line.split()
+                    # A torn last line from a crash is just an unknown key.
+                    if not parts or len(parts[0]) != 64:
+                        continue
+                    self._lines += 1
+                    try:
+                        stamp = float(parts[1]) if len(parts) > 1 else now
+                    except ValueError:
+                        continue
+                    self._committed[parts[0]] = stamp
+                    self._committed.move_to_end(parts[0])
+        self._expire(now)
+        self._file = open(path, "a")
+        self._maybe_compact()
+
+    def _expire(self, now):
+        cutoff = now - self.ttl
+        while self._committed:
+            key, stamp = next(iter(self._committed.items()))
+            if stamp > cutoff:
+                break
+            del self._committed[key]
+
+    def _maybe_compact(self):
+        if self._lines > 2 * len(self._committed) + 1000:
+            self._compact()
+
+    def _compact(self):
+        data = "".join(f"{key} {stamp:.3f}\n" for key, stamp in self._committed.items()).encode()
+        self._file.close()
+        write_atomic(self.path, data)
+        self._file = open(self.path, "a")
+        self._lines = len(self._committed)
+
+    def claim(self, key):
+        """True if the caller should commit this key; False if it is done or in flight."""
+        with self._lock:
+            self._expire(time.time())
+            if key in self._committed or key in self._pending:
+                return False
+            self._pending.add(key)
+            return True
+
+    def confirm(self, key):
+        with self._lock:
+            now = time.time()
+            self._file.write(f"{key} {now:.3f}\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._lines += 1
+            self._pending.discard(key)
+            self._committed[key] = now
+            self._committed.move_to_end(key)
+            self._expire(now)
+            self._maybe_compact()
+
+    def release(self, key):
+        with self._lock:
+            self._pending.discard(key)
+
+    def __contains__(self, key):
+        return key in self._committed
+
+    def __len__(self):
+        return len(self._committed)
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,119 @@
+import sys
+import threading
+import time
+
+from common.txlog import HEADER, ReplicaLog, file_version, read_entries, read_log_header
+
+
+class ReplicaIndex:
+    """ID-keyed view of one replica that follows the replica's log.
+
+    Lookups only touch the dict. The files are re-checked at most once per
+    refresh_interval, and a grown log is read from the last offset seen.
+    Every ID carries a version that moves whenever its visible record does."""
+
+    def __init__(self, base_path, refresh_interval=1.0):
+        self.base_path = base_path
+        self.refresh_interval = refresh_interval
+        self.index = {}
+        self.versions = {}
+        self.generation = None
+        self.log_offset = 0
+        self._snapshot_stat = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            snapshot_stat = file_version(self.base_path + ".snapshot.json")
+            replica = ReplicaLog(self.base_path, readonly=True)
+            index = {}
+            for record in replica:
+                index.setdefault(record["ID"], record)
+            old = self.index
+            for item_id in old.keys() | index.keys():
+                if old.get(item_id) != index.get(item_id):
+                    self._bump(item_id)
+            self.index = index
+            self.generation = replica.generation
+            self.log_offset = replica.log_offset
+            self._snapshot_stat = snapshot_stat
+            self._checked = time.monotonic()
+
+    def refresh(self):
+        self._checked = time.monotonic()
+        if file_version(self.base_path + ".snapshot.json") != self._snapshot_stat:
+            return self.reload()
+        log_path = self.base_path + ".log"
+        log_stat = file_version(log_path)
+        if log_stat is None or log_stat[1] == self.log_offset:
+            return
+        with self._lock, open(log_path, "rb") as f:
+            if read_log_header(f) != self.generation or log_stat[1] < self.log_offset:
+                stale = True
+            else:
+                stale = False
+                f.seek(max(self.log_offset, HEADER.size))
+                for entry, offset in read_entries(f):
+                    self._apply(entry)
+                    self.log_offset = offset
+        if stale:
+            self.reload()
+
+    def _bump(self, item_id):
+        self.versions[item_id] = self.versions.get(item_id, 0) + 1
+
+    def _apply(self, entry):
+        if entry["op"] == "add":
+            self.apply(entry["record"])
+        elif entry["op"] == "put":
+            self._bump(entry["id"])
+            if entry["records"]:
+                self.index[entry["id"]] = entry["records"][0]
+            else:
+                self.index.pop(entry["id"], None)
+
+    def apply(self, record):
+        if record["ID"] not in self.index:
+            self._bump(record["ID"])
+            self.index[record["ID"]] = record
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._checked >= self.refresh_interval:
+            self.refresh()
+
+    def get(self, item_id):
+        self._maybe_refresh()
+        return self.index.get(item_id)
+
+    def version(self, item_id):
+        self._maybe_refresh()
+        return self.versions.get(item_id, 0)
+
+    def get_many(self, item_ids):
+        self._maybe_refresh()
+        index = self.index
+        return {item_id: index.get(item_id) for item_id in item_ids}
+
+    def scan(self, predicate):
+        self._maybe_refresh()
+        with self._lock:
+            records = list(self.index.values())
+        return [record for record in records if predicate(record)]
+
+    def footprint(self):
+        # Copy under the lock so a concurrent refresh cannot resize the dict mid-walk.
+        with self._lock:
+            items = list(self.index.items())
+        size = sys.getsizeof(self.index)
+        for item_id, record in items:
+            size += sys.getsizeof(item_id) + sys.getsizeof(record)
+            size += sum(sys.getsizeof(v) for v in record.values())
+        per_record = size / len(items) if items else 0
+        return {
+            "indexed_ids": len(items),
+            "bytes": size,
+            "bytes_per_million": int(per_record * 1_000_000),
+        }
+
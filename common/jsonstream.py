@@ -0,0 +1,118 @@
+"""Read and rewrite replica JSON arrays a record at a time.
+
+iter_records() decodes one array element at a time from a fixed-size read
+buffer, so memory stays bounded by the largest record rather than the file,
+and a lookup stops reading at the first match. write_array() produces the
+same bytes as json.dump(records, f, indent=2).
+"""
+import json
+import os
+import re
+
+from common.atomicfile import atomic_open
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read another chunk, dropping what has been consumed; False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or "" at end of file."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def value(self):
+        first = self.peek()
+        if first not in '{["':
+            # A bare number or literal is only complete once its delimiter is buffered.
+            while "," not in self.buf[self.pos:] and "]" not in self.buf[self.pos:] and self.fill():
+                pass
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            self.pos = end
+            return value
+
+
+def iter_records(f, chunk_size=CHUNK_SIZE):
+    """Yield the elements of the JSON array in text file f; an empty file has none."""
+    reader = _Reader(f, chunk_size)
+    first = reader.peek()
+    if first == "":
+        return
+    if first != "[":
+        raise ValueError("replica is not a JSON array")
+    reader.pos += 1
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        sep = reader.peek()
+        if sep == "]":
+            return
+        if sep != ",":
+            raise ValueError(f"expected ',' or ']' in replica, found {sep or 'end of file'!r}")
+        reader.pos += 1
+
+
+def read_records(path, chunk_size=CHUNK_SIZE):
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        yield from iter_records(f, chunk_size)
+
+
+def find_record(path, item_id):
+    """First record with this ID, reading no further than it."""
+    return next((record for record in read_records(path) if record["ID"] == item_id), None)
+
+
+def scan(path, predicate):
+    return (record for record in read_records(path) if predicate(record))
+
+
+def write_array(records, f):
+    count = 0
+    f.write("[")
+    for record in records:
+        f.write(",\n" if count else "\n")
+        f.write("\n".join("  " + line for line in json.dumps(record, indent=2).splitlines()))
+        count += 1
+    f.write("\n]" if count else "]")
+    return count
+
+
+def rewrite(path, records, dest=None):
+    """Stream records (usually a transform of read_records(path)) into dest, atomically."""
+    dest = dest or path
+    with atomic_open(dest, "w", encoding="utf-8") as out:
+        return write_array(records, out)
@@ -0,0 +1,126 @@
+"""Generate RSA node keys in the keyring format, searching for primes in parallel.
+
+    python -m common.keygen --bits 2048 --out DATA/keys.json
+    python -m common.keygen --bits 3072 --out DATA/keys.json --node "Inventory B"
+
+With --node only that node's key is replaced (a rotation). Running apps pick
+up the new file without a restart.
+"""
+import argparse
+import json
+import math
+import os
+import secrets
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from common.atomicfile import atomic_open
+from common.parameters import INVENTORY_KEYS
+
+DEFAULT_E = 65537
+SMALL_PRIMES = [p for p in range(3, 2000, 2) if all(p % d for d in range(3, int(p ** 0.5) + 1, 2))]
+
+
+def is_probable_prime(n, rounds=40):
+    if n < 2:
+        return False
+    if n in (2, 3):
+        return True
+    if n % 2 == 0:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for _ in range(rounds):
+        a = secrets.randbelow(n - 3) + 2
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def search_prime(bits, e=DEFAULT_E, attempts=200):
+    """Try up to `attempts` random candidates; the unit of work sent to each worker."""
+    for _ in range(attempts):
+        # Top two bits set so the product of two such primes has exactly 2*bits bits.
+        candidate = secrets.randbits(bits) | (3 << (bits - 2)) | 1
+        if math.gcd(e, candidate - 1) == 1 and is_probable_prime(candidate):
+            return candidate
+    return None
+
+
+def random_primes(bits, count, e=DEFAULT_E, pool=None, workers=None):
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    found = set()
+    try:
+        width = workers or os.cpu_count() or 1
+        pending = {pool.submit(search_prime, bits, e) for _ in range(width)}
+        while len(found) < count:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                prime = future.result()
+                if prime is not None:
+                    found.add(prime)
+                if len(found) < count:
+                    pending.add(pool.submit(search_prime, bits, e))
+        for future in pending:
+            future.cancel()
+    finally:
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+    return sorted(found)[:count]
+
+
+def generate_node_key(bits=2048, e=DEFAULT_E, pool=None, workers=None):
+    p, q = random_primes(bits // 2, 2, e, pool, workers)
+    return {"p": p, "q": q, "e": e}
+
+
+def generate_keyring(nodes, bits=2048, e=DEFAULT_E, workers=None):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        primes = random_primes(bits // 2, 2 * len(nodes), e, pool, workers)
+    return {node: {"p": primes[2 * i], "q": primes[2 * i + 1], "e": e} for i, node in enumerate(nodes)}
+
+
+def load_keys(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_keys(path, params):
+    with atomic_open(path, "w") as f:
+        json.dump(params, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bits", type=int, default=2048)
+    parser.add_argument("--e", type=int, default=DEFAULT_E)
+    parser.add_argument("--out", default=os.path.join("DATA", "keys.json"))
+    parser.add_argument("--node", action="append", help="rotate only this node (repeatable)")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    params = load_keys(args.out) if os.path.exists(args.out) else dict(INVENTORY_KEYS)
+    nodes = args.node or list(INVENTORY_KEYS)
+    unknown = [node for node in nodes if node not in INVENTORY_KEYS]
+    if unknown:
+        parser.error(f"unknown node(s): {', '.join(unknown)}")
+    params.update(generate_keyring(nodes, args.bits, args.e, args.workers))
+    write_keys(args.out, params)
+    print(f"wrote {args.bits}-bit keys for {', '.join(nodes)} to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+
+from common.cache import fingerprint
+
+
+def mod_inverse(e, phi):
+    return pow(e, -1, phi)
+
+
+class CRTFaultError(Exception):
+    pass
+
+
+class RSAKey:
+    def __init__(self, e, n, d=None, p=None, q=None, use_crt=None):
+        self.e = e
+        self.n = n
+        self.d = d
+        self.p = p
+        self.q = q
+        self._fingerprint = None
+        self.use_crt = (p is not None and q is not None) if use_crt is None else use_crt
+        if self.use_crt and (p is None or q is None):
+            raise ValueError("CRT mode needs both primes")
+        self.phi = None
+        self.dp = self.dq = self.qinv = None
+        if p is not None and q is not None:
+            self.phi = (p - 1) * (q - 1)
+            if d is None:
+                self.d = mod_inverse(e, self.phi)
+            self.dp = self.d % (p - 1)
+            self.dq = self.d % (q - 1)
+            self.qinv = mod_inverse(q, p)
+
+    @classmethod
+    def from_primes(cls, p, q, e):
+        return cls(e, p * q, p=p, q=q)
+
+    STATE = ("e", "n", "d", "p", "q", "use_crt", "phi", "dp", "dq", "qinv")
+
+    def state(self):
+        """The key and everything derived from it, as plain ints."""
+        return {name: getattr(self, name) for name in self.STATE}
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a key from state() without redoing the modular inverses."""
+        key = cls.__new__(cls)
+        for name in cls.STATE:
+            setattr(key, name, state[name])
+        key._fingerprint = None
+        return key
+
+    @property
+    def public_key(self):
+        return (self.e, self.n)
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.e, self.n)
+        return self._fingerprint
+
+    @property
+    def private_key(self):
+        return (self.d, self.n)
+
+    def private_op(self, c):
+        if not self.use_crt:
+            return pow(c, self.d, self.n)
+        # Garner recombination of the two half-size exponentiations.
+        m1 = pow(c, self.dp, self.p)
+        m2 = pow(c, self.dq, self.q)
+        h = (self.qinv * (m1 - m2)) % self.p
+        m = m2 + h * self.q
+        # A fault in either half would leak a factor of n, so check before releasing.
+        if pow(m, self.e, self.n) != c % self.n:
+            raise CRTFaultError("CRT result failed verification")
+        return m
+
+
+class Keyring:
+    """Per-node RSA keys derived once at startup instead of on every request.
+
+    Keys can be swapped at runtime with rotate(), or by watching a keys file
+    that is re-read (at most once per interval) when it changes. Retired keys
+    stay reachable by fingerprint so older signatures can still be checked."""
+
+    def __init__(self, keys=None):
+        self._keys = dict(keys or {})
+        self._history = {key.fingerprint: key for key in self._keys.values()}
+        self._lock = threading.Lock()
+        self._watch_path = None
+        self._watch_stat = None
+        self._watch_interval = 1.0
+        self._checked = 0.0
+
+    @classmethod
+    def from_params(cls, params):
+        return cls({node: RSAKey.from_primes(k["p"], k["q"], k["e"]) for node, k in params.items()})
+
+    def rotate(self, node, key):
+        with self._lock:
+            keys = dict(self._keys)
+            keys[node] = key
+            self._keys = keys
+            self._history[key.fingerprint] = key
+
+    def by_fingerprint(self, key_fp):
+        return self._history.get(key_fp)
+
+    def watch(self, path, interval=1.0):
+        self._watch_path = path
+        self._watch_interval = interval
+        self._checked = 0.0
+        self._maybe_reload()
+        return self
+
+    def _maybe_reload(self):
+        if self._watch_path is None or time.monotonic() - self._checked < self._watch_interval:
+            return
+        self._checked = time.monotonic()
+        try:
+            st = os.stat(self._watch_path)
+        except FileNotFoundError:
+            return
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self._watch_stat:
+            return
+        with open(self._watch_path) as f:
+            params = json.load(f)
+        self._watch_stat = stat
+        for node, k in params.items():
+            current = self._keys.get(node)
+            if current is None or (current.p, current.q, current.e) != (k["p"], k["q"], k["e"]):
+                self.rotate(node, RSAKey.from_primes(k["p"], k["q"], k["e"]))
+
+    def __getitem__(self, node):
+        self._maybe_reload()
+        return self._keys[node]
+
+    def __contains__(self, node):
+        return node in self._keys
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def nodes(self):
+        return list(self._keys)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+
+
+def canonical(record):
+    return json.dumps(record, sort_keys=True, separators=(",", ":")).encode()
+
+
+def leaf_hash(record):
+    return hashlib.sha256(b"\x00" + canonical(record)).digest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def _next_level(level):
+    # An unpaired node is promoted as-is rather than hashed with a copy of itself.
+    nxt = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        nxt.append(level[-1])
+    return nxt
+
+
+def merkle_root(leaves):
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    level = list(leaves)
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+
+def merkle_proof(leaves, index):
+    """Sibling path from leaf `index` to the root as [(side, hex hash), ...]."""
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(("L" if sibling < index else "R", level[sibling].hex()))
+        level = _next_level(level)
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, proof, root):
+    h = leaf
+    for side, sibling in proof:
+        sibling = bytes.fromhex(sibling)
+        h = node_hash(sibling, h) if side == "L" else node_hash(h, sibling)
+    return h == root
+
+
+class BucketMerkleTree:
+    """Fixed-shape Merkle tree over a replica, bucketed by hash of ID.
+
+    Every replica with the same records has the same tree whatever the insert
+    order, so two replicas can be compared top-down and only the subtrees
+    whose hashes differ need to be explored. A leaf's value is the sum of its
+    records' hashes, so adding or removing a record only rehashes one path."""
+
+    MOD = 1 << 256
+
+    def __init__(self, depth=12):
+        self.depth = depth
+        self.leaves = [0] * (1 << depth)
+        self.buckets = [None] * (1 << depth)
+        self._rebuild()
+
+    @classmethod
+    def build(cls, records, depth=12):
+        tree = cls.__new__(cls)
+        tree.depth = depth
+        tree.leaves = [0] * (1 << depth)
+        tree.buckets = [None] * (1 << depth)
+        for record in records:
+            b, h = tree._locate(record)
+            bucket = tree.buckets[b]
+            if bucket is None:
+                bucket = tree.buckets[b] = {}
+            bucket[record["ID"]] = (bucket.get(record["ID"], 0) + h) % cls.MOD
+            tree.leaves[b] = (tree.leaves[b] + h) % cls.MOD
+        tree._rebuild()
+        return tree
+
+    def _rebuild(self):
+        self.levels = [[leaf.to_bytes(32, "big") for leaf in self.leaves]]
+        while len(self.levels[0]) > 1:
+            below = self.levels[0]
+            self.levels.insert(0, [node_hash(below[i], below[i + 1]) for i in range(0, len(below), 2)])
+
+    def _locate(self, record):
+        return self.bucket_of(record["ID"]), int.from_bytes(leaf_hash(record), "big")
+
+    def bucket_of(self, item_id):
+        return int.from_bytes(hashlib.sha256(str(item_id).encode()).digest()[:4], "big") >> (32 - self.depth)
+
+    def _update(self, record, sign):
+        item_id = record["ID"]
+        b, h = self._locate(record)
+        bucket = self.buckets[b]
+        if bucket is None:
+            bucket = self.buckets[b] = {}
+        acc = (bucket.get(item_id, 0) + sign * h) % self.MOD
+        if acc:
+            bucket[item_id] = acc
+        else:
+            bucket.pop(item_id, None)
+        self.leaves[b] = (self.leaves[b] + sign * h) % self.MOD
+        level = self.depth
+        self.levels[level][b] = self.leaves[b].to_bytes(32, "big")
+        while level > 0:
+            b //= 2
+            level -= 1
+            below = self.levels[level + 1]
+            self.levels[level][b] = node_hash(below[2 * b], below[2 * b + 1])
+
+    def add(self, record):
+        self._update(record, 1)
+
+    def remove(self, record):
+        self._update(record, -1)
+
+    @property
+    def root(self):
+        return self.levels[0][0]
+
+    def node(self, level, index):
+        return self.levels[level][index]
+
+    def bucket(self, index):
+        return self.buckets[index] or {}
+
+
+def diff_trees(a, b):
+    """IDs whose records differ between two trees, and how many nodes were compared."""
+    if a.depth != b.depth:
+        raise ValueError("trees must have the same depth")
+    ids = set()
+    exchanges = 0
+    stack = [(0, 0)]
+    while stack:
+        level, index = stack.pop()
+        exchanges += 1
+        if a.node(level, index) == b.node(level, index):
+            continue
+        if level == a.depth:
+            left, right = a.bucket(index), b.bucket(index)
+            ids.update(i for i in left.keys() | right.keys() if left.get(i) != right.get(i))
+        else:
+            stack.append((level + 1, 2 * index))
+            stack.append((level + 1, 2 * index + 1))
+    return ids, exchanges
@@ -0,0 +1,51 @@
+import hashlib
+import json
+
+from common.cache import VERIFY_CACHE, fingerprint
+from common.signatures import hash_message
+
+
+class MultisigContext:
+    """Harn multisignature over a fixed set of node identities.
+
+    Each node's factor identity^r mod n depends only on the static parameters,
+    so it is computed once here (or taken from the startup parameter cache).
+    Signing and verifying then cost one hash and one modular multiply per node."""
+
+    def __init__(self, identities, randoms, n, factors=None):
+        self.identities = dict(identities)
+        self.randoms = dict(randoms)
+        self.n = n
+        if factors is None:
+            factors = {label: pow(identities[label], randoms[label], n) for label in identities}
+        self.factors = dict(factors)
+        self.fingerprint = fingerprint(n, sorted(self.identities.items()), sorted(self.randoms.items()))
+
+    def sign(self, label, message):
+        return hash_message(message, self.identities[label]) * self.factors[label] % self.n
+
+    def sign_many(self, label, messages):
+        identity, factor, n = self.identities[label], self.factors[label], self.n
+        return [hash_message(message, identity) * factor % n for message in messages]
+
+    def sign_round(self, messages):
+        """Partial signatures for one round, messages mapping label -> message."""
+        return {label: self.sign(label, message) for label, message in messages.items()}
+
+    def aggregate(self, sigs):
+        return sum(sigs) % self.n
+
+    def aggregate_many(self, rounds):
+        return [self.aggregate(sigs.values() if isinstance(sigs, dict) else sigs) for sigs in rounds]
+
+    def expected(self, messages):
+        n = self.n
+        return sum(hash_message(messages[label], self.identities[label]) * self.factors[label]
+                   for label in self.identities) % n
+
+    def verify(self, agg_sig, messages):
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+        return VERIFY_CACHE.verify(self.fingerprint, digest, agg_sig, lambda: agg_sig == self.expected(messages))
+
+    def verify_many(self, agg_sigs, message_rounds):
+        return [self.verify(agg, messages) for agg, messages in zip(agg_sigs, message_rounds)]
@@ -0,0 +1,151 @@
+"""Precompiled startup parameters and key material.
+
+Both apps need the same derived values on every start: the parsed
+parameters.txt sections, the procurement key's private exponent and CRT
+values, the multisig factors and the per-node inventory keys. build()
+derives them once and writes them to CACHE_FILE as
+
+    magic | sha256(payload) | marshal(payload)
+
+so a later start loads everything with one read. The payload records the
+(mtime, size) of the files it was compiled from; if any of them changed, or
+the checksum does not match, the cache is rebuilt.
+
+    python -m common.paramcache [--force]   compile ahead of time
+"""
+import argparse
+import hashlib
+import json
+import marshal
+import os
+import sys
+
+from common import parameters
+from common.atomicfile import write_atomic
+from common.keys import Keyring, RSAKey
+from common.multisig import MultisigContext
+from common.parameters import KEYS_FILE, PARAMETERS_FILE, load_parameters
+from common.txlog import file_version
+
+CACHE_FILE = os.environ.get("PARAMS_CACHE_FILE", os.path.join("DATA", "params.cache"))
+CACHE_MAGIC = b"INVPCC1\n"
+FORMAT = 1
+
+
+def sources(params_path=PARAMETERS_FILE, keys_path=KEYS_FILE):
+    """The inputs a cache depends on: parameters.txt, the keys file and the built-in keys."""
+    paths = [params_path, keys_path, parameters.__file__]
+    return [(path, file_version(path)) for path in paths]
+
+
+def _read_keys_file(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def build(params_path=PARAMETERS_FILE, keys_path=KEYS_FILE):
+    """Parse and derive everything the apps need at startup."""
+    src = sources(params_path, keys_path)
+    identities, randoms, pkg_keys, procurement_keys = load_parameters(params_path)
+    n = pkg_keys["p"] * pkg_keys["q"]
+    rotated = _read_keys_file(keys_path)
+    return {
+        "format": FORMAT,
+        "python": tuple(sys.version_info[:2]),
+        "sources": src,
+        "identities": identities,
+        "randoms": randoms,
+        "pkg_keys": pkg_keys,
+        "procurement_keys": procurement_keys,
+        "procurement_key": RSAKey.from_primes(**procurement_keys).state(),
+        "multisig_n": n,
+        "multisig_factors": {label: pow(identities[label], randoms[label], n) for label in identities},
+        "inventory_keys": {node: RSAKey.from_primes(k["p"], k["q"], k["e"]).state()
+                           for node, k in parameters.INVENTORY_KEYS.items()},
+        "rotated_keys": {node: RSAKey.from_primes(k["p"], k["q"], k["e"]).state()
+                         for node, k in rotated.items()},
+    }
+
+
+def encode(compiled):
+    payload = marshal.dumps(compiled)
+    return CACHE_MAGIC + hashlib.sha256(payload).digest() + payload
+
+
+def decode(data):
+    """The compiled dict in data, or None if it is truncated, corrupt or foreign."""
+    header = len(CACHE_MAGIC) + 32
+    if len(data) < header or data[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+        return None
+    payload = data[header:]
+    if hashlib.sha256(payload).digest() != data[len(CACHE_MAGIC):header]:
+        return None
+    try:
+        compiled = marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(compiled, dict) or compiled.get("format") != FORMAT \
+            or compiled.get("python") != tuple(sys.version_info[:2]):
+        return None
+    return compiled
+
+
+def write(compiled, path=CACHE_FILE):
+    write_atomic(path, encode(compiled))
+
+
+def load(params_path=PARAMETERS_FILE, keys_path=KEYS_FILE, cache_path=CACHE_FILE):
+    """The compiled parameters, from the cache when it is current, else rebuilt."""
+    try:
+        with open(cache_path, "rb") as f:
+            compiled = decode(f.read())
+    except FileNotFoundError:
+        compiled = None
+    if compiled is not None and compiled["sources"] == sources(params_path, keys_path):
+        return compiled
+    compiled = build(params_path, keys_path)
+    try:
+        write(compiled, cache_path)
+    except OSError:
+        # A read-only data directory just means compiling on every start.
+        pass
+    return compiled
+
+
+def procurement_key(compiled):
+    return RSAKey.from_state(compiled["procurement_key"])
+
+
+def multisig(compiled):
+    return MultisigContext(compiled["identities"], compiled["randoms"], compiled["multisig_n"],
+                           factors=compiled["multisig_factors"])
+
+
+def keyring(compiled):
+    """The built-in keys, with the keys file's rotations applied on top."""
+    ring = Keyring({node: RSAKey.from_state(state) for node, state in compiled["inventory_keys"].items()})
+    for node, state in compiled["rotated_keys"].items():
+        current = ring[node] if node in ring else None
+        if current is None or (current.p, current.q, current.e) != (state["p"], state["q"], state["e"]):
+            ring.rotate(node, RSAKey.from_state(state))
+    return ring
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--params", default=PARAMETERS_FILE)
+    parser.add_argument("--keys", default=KEYS_FILE)
+    parser.add_argument("--out", default=CACHE_FILE)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the cache is current")
+    args = parser.parse_args(argv)
+    if args.force:
+        write(build(args.params, args.keys), args.out)
+    else:
+        load(args.params, args.keys, args.out)
+    print(args.out)
+
+
+if __name__ == "__main__":
+    main()
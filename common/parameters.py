@@ -0,0 +1,55 @@
+import os
+
+KEYS_FILE = os.environ.get("INVENTORY_KEYS_FILE", os.path.join("DATA", "keys.json"))
+PARAMETERS_FILE = "parameters.txt"
+
+INVENTORY_KEYS = {
+    "Inventory A": {
+        "p": 1210613765735147311106936311866593978079938707,
+        "q": 1247842850282035753615951347964437248190231863,
+        "e": 815459040813953176289801
+    },
+    "Inventory B": {
+        "p": 787435686772982288169641922308628444877260947,
+        "q": 1325305233886096053310340418467385397239375379,
+        "e": 692450682143089563609787
+    },
+    "Inventory C": {
+        "p": 1014247300991039444864201518275018240361205111,
+        "q": 904030450302158058469475048755214591704639633,
+        "e": 1158749422015035388438057
+    },
+    "Inventory D": {
+        "p": 1287737200891425621338551020762858710281638317,
+        "q": 1330909125725073469794953234151525201084537607,
+        "e": 33981230465225879849295979
+    }
+}
+
+
+def load_parameters(filepath=PARAMETERS_FILE):
+    section = None
+    identities = {}
+    randoms = {}
+    pkg_keys = {}
+    procurement_keys = {}
+
+    with open(filepath, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                section = line[1:-1]
+                continue
+            key, val = line.split(",", 1)
+            val = int(val)
+            if section == "Identities":
+                identities[key] = val
+            elif section == "RandomValues":
+                randoms[key] = val
+            elif section == "PKGKeys":
+                pkg_keys[key] = val
+            elif section == "ProcurementKeys":
+                procurement_keys[key] = val
+    return identities, randoms, pkg_keys, procurement_keys
@@ -0,0 +1,72 @@
+import hashlib
+
+from common.cache import VERIFY_CACHE, fingerprint
+from common.keys import RSAKey
+
+
+def hash_message(msg, identity=None):
+    """SHA-256 of msg as an int; multisig partials also bind the signer's identity."""
+    if identity:
+        msg += f"::{identity}"
+    return int(hashlib.sha256(msg.encode()).hexdigest(), 16)
+
+
+def sign_message(msg, private_key):
+    m = hash_message(msg)
+    if isinstance(private_key, RSAKey):
+        return private_key.private_op(m)
+    d, n = private_key
+    return pow(m, d, n)
+
+
+def verify_signature(msg, sig, public_key):
+    e, n = public_key
+    m = hash_message(msg)
+    return pow(sig, e, n) == m
+
+
+def _screen(hashes, sigs, e, n):
+    sig_prod = 1
+    hash_prod = 1
+    for m, sig in zip(hashes, sigs):
+        sig_prod = sig_prod * sig % n
+        hash_prod = hash_prod * m % n
+    return pow(sig_prod, e, n) == hash_prod
+
+
+def batch_verify(msgs, sigs, public_key):
+    # Screening: one exponentiation for the whole batch. It proves each message
+    # was signed, not that every signature value is the exact one produced.
+    if len(msgs) != len(sigs):
+        raise ValueError("messages and signatures differ in length")
+    e, n = public_key
+    return _screen([hash_message(msg) for msg in msgs], sigs, e, n)
+
+
+def find_invalid_signatures(msgs, sigs, public_key):
+    if len(msgs) != len(sigs):
+        raise ValueError("messages and signatures differ in length")
+    e, n = public_key
+    hashes = [hash_message(msg) for msg in msgs]
+    bad = []
+
+    def bisect(lo, hi):
+        if hi - lo == 1:
+            if pow(sigs[lo], e, n) != hashes[lo]:
+                bad.append(lo)
+            return
+        if _screen(hashes[lo:hi], sigs[lo:hi], e, n):
+            return
+        mid = (lo + hi) // 2
+        bisect(lo, mid)
+        bisect(mid, hi)
+
+    if msgs:
+        bisect(0, len(msgs))
+    return bad
+
+
+def cached_verify(msg, sig, public_key):
+    e, n = public_key
+    return VERIFY_CACHE.verify(fingerprint(e, n), hash_message(msg), sig,
+                               lambda: verify_signature(msg, sig, public_key))
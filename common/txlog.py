@@ -0,0 +1,251 @@
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+
+from common.atomicfile import write_atomic
+from common.jsonstream import read_records
+from common.merkle import BucketMerkleTree
+
+DATA_DIR = "DATA"
+LOG_MAGIC = b"INVLOG1\n"
+HEADER = struct.Struct(">8sQ")
+ENTRY = struct.Struct(">II")
+
+
+def replica_base(letter, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f"inventory_{letter.lower()}")
+
+
+def encode_entry(entry):
+    payload = json.dumps(entry, separators=(",", ":")).encode()
+    return ENTRY.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_log_header(f):
+    raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        return None
+    magic, generation = HEADER.unpack(raw)
+    if magic != LOG_MAGIC:
+        raise ValueError(f"{f.name} is not an inventory log")
+    return generation
+
+
+def read_entries(f):
+    """Yield (entry, end_offset) for every complete entry from the current position.
+
+    A torn or corrupt tail (crash mid-append) ends the scan."""
+    while True:
+        start = f.tell()
+        raw = f.read(ENTRY.size)
+        if len(raw) < ENTRY.size:
+            f.seek(start)
+            return
+        length, crc = ENTRY.unpack(raw)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            f.seek(start)
+            return
+        yield json.loads(payload), f.tell()
+
+
+def file_version(path):
+    """(mtime_ns, size) of path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class ReplicaLog:
+    """Inventory replica kept as a compacted snapshot plus an append-only log.
+
+    Writes append one length-prefixed, checksummed entry per record and fsync,
+    so their cost does not depend on the replica size. The snapshot is rewritten
+    only once the log tail has grown as large as the snapshot itself."""
+
+    def __init__(self, base_path, readonly=False, compact_min=1000):
+        self.base_path = base_path
+        self.log_path = base_path + ".log"
+        self.snapshot_path = base_path + ".snapshot.json"
+        self.json_path = base_path + ".json"
+        self.readonly = readonly
+        self.compact_min = compact_min
+        self.records = []
+        self.live = 0
+        self._positions = {}
+        self._merkle = None
+        self.generation = 0
+        self.log_offset = 0
+        self.tail_entries = 0
+        self._log = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        has_snapshot = os.path.exists(self.snapshot_path)
+        if has_snapshot:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            self.generation = snapshot["generation"]
+            self._reset(snapshot["records"])
+        elif os.path.exists(self.json_path):
+            self._reset(read_records(self.json_path))
+
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                if read_log_header(f) == self.generation:
+                    self.log_offset = HEADER.size
+                    for entry, offset in read_entries(f):
+                        self._apply(entry)
+                        self.log_offset = offset
+                        self.tail_entries += 1
+
+        if self.readonly:
+            return
+        if not has_snapshot:
+            # Seed from the legacy JSON file exactly once.
+            self._compact()
+        elif self.log_offset:
+            # Drop any torn tail left by a crash before appending after it.
+            with open(self.log_path, "r+b") as f:
+                f.truncate(self.log_offset)
+            self._log = open(self.log_path, "ab")
+        else:
+            self._start_log()
+
+    def _start_log(self):
+        if self._log:
+            self._log.close()
+        write_atomic(self.log_path, HEADER.pack(LOG_MAGIC, self.generation))
+        self._log = open(self.log_path, "ab")
+        self.log_offset = HEADER.size
+        self.tail_entries = 0
+
+    def _reset(self, records):
+        self.records = list(records)
+        self.live = len(self.records)
+        self._positions = {}
+        for slot, record in enumerate(self.records):
+            self._positions.setdefault(record["ID"], []).append(slot)
+        self._merkle = None
+
+    def _add(self, record):
+        self._positions.setdefault(record["ID"], []).append(len(self.records))
+        self.records.append(record)
+        self.live += 1
+        if self._merkle:
+            self._merkle.add(record)
+
+    def _put(self, item_id, records):
+        # Replace every record with this ID: the first slot is reused so the
+        # item keeps its position, older duplicates become tombstones.
+        slots = self._positions.pop(item_id, [])
+        for slot in slots:
+            if self._merkle:
+                self._merkle.remove(self.records[slot])
+            self.records[slot] = None
+        self.live -= len(slots)
+        if slots and records:
+            self.records[slots[0]] = records[0]
+            self._positions[item_id] = [slots[0]]
+            self.live += 1
+            if self._merkle:
+                self._merkle.add(records[0])
+            records = records[1:]
+        for record in records:
+            self._add(record)
+
+    def _apply(self, entry):
+        if entry["op"] == "add":
+            self._add(entry["record"])
+        elif entry["op"] == "put":
+            self._put(entry["id"], entry["records"])
+        else:
+            raise ValueError(f"unknown log op {entry['op']!r}")
+
+    def get_all(self, item_id):
+        return [self.records[slot] for slot in self._positions.get(item_id, [])]
+
+    @property
+    def merkle(self):
+        if self._merkle is None:
+            self._merkle = BucketMerkleTree.build(self)
+        return self._merkle
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        self._write([{"op": "add", "record": record} for record in records])
+
+    def put(self, item_id, records):
+        """Make `records` the only records stored under item_id; [] deletes it."""
+        self._write([{"op": "put", "id": item_id, "records": list(records)}])
+
+    def upsert(self, records):
+        """Store each record as the only one under its ID, in one log write."""
+        self._write([{"op": "put", "id": record["ID"], "records": [record]} for record in records])
+
+    def _write(self, entries):
+        if self.readonly:
+            raise PermissionError(f"{self.base_path} is open read-only")
+        data = b"".join(encode_entry(entry) for entry in entries)
+        with self._lock:
+            self._log.write(data)
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self.log_offset += len(data)
+            for entry in entries:
+                self._apply(entry)
+            self.tail_entries += len(entries)
+            if self.tail_entries >= max(self.compact_min, len(self.records) - self.tail_entries):
+                self._compact()
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        self.generation += 1
+        if self.live != len(self.records):
+            merkle = self._merkle
+            self._reset(r for r in self.records if r is not None)
+            self._merkle = merkle
+        snapshot = {"generation": self.generation, "records": self.records}
+        write_atomic(self.snapshot_path, json.dumps(snapshot, separators=(",", ":")).encode())
+        # A crash here leaves a log from the previous generation, which the
+        # next load recognises as already folded into the snapshot.
+        self._start_log()
+
+    def export_json(self, path=None):
+        with self._lock:
+            data = json.dumps(list(self), indent=2).encode()
+        write_atomic(path or self.json_path, data)
+
+    def close(self):
+        if self._log:
+            self._log.close()
+            self._log = None
+
+    def __len__(self):
+        return self.live
+
+    def __iter__(self):
+        return (r for r in list(self.records) if r is not None)
+
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    # Once the commit log backend has taken a replica over, its log and
+    # snapshot here are stale; exporting them would overwrite newer data.
+    if any(os.path.exists(replica_base(letter, data_dir) + ".applied.json") for letter in "abcd"):
+        sys.exit(f"{data_dir} is managed by the commitlog backend; use python -m common.export instead")
+    for letter in "abcd":
+        replica = ReplicaLog(replica_base(letter, data_dir), readonly=True)
+        replica.export_json()
+        print(f"exported {len(replica)} records to {replica.json_path}")
@@ -0,0 +1,296 @@
+"""Run Inventory A-D as separate processes that vote over localhost HTTP.
+
+    python part1/nodes.py serve
+    python part1/nodes.py bench --rounds 200 --concurrency 8 [--kill "Inventory D"]
+
+Each node owns its private key and its replica under DATA/nodes/. A proposal
+sent to one node is signed there, broadcast to every node's /verify, and on
+quorum committed through every node's /commit. The signed message carries the
+proposal's idempotency token, each vote is signed by its voter, and /commit
+only writes a record that comes with a quorum of valid votes for it.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import paramcache
+from common.consensus import ConsensusEngine
+from common.idempotency import IdempotencyLog, idempotency_key, new_token
+from common.parameters import INVENTORY_KEYS, KEYS_FILE
+from common.signatures import cached_verify, sign_message
+from common.txlog import ReplicaLog, replica_base
+
+NODE_DATA_DIR = os.path.join("DATA", "nodes")
+BASE_PORT = 8600
+
+
+def node_ports(base_port=BASE_PORT):
+    return {node: base_port + i for i, node in enumerate(INVENTORY_KEYS)}
+
+
+def post_json(url, payload, timeout=2.0):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def get_json(url, timeout=2.0):
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def transaction_message(item_id, qty, price, token):
+    return f"Item: {item_id} | QTY: {qty} | Price: {price} | Txn: {token}"
+
+
+def vote_message(message):
+    return f"Vote: {message}"
+
+
+def request_vote(url, payload, timeout, votes, peer):
+    """Ask one peer to verify; a signed accept is kept in votes for the commit."""
+    reply = post_json(url + "/verify", payload, timeout)
+    if reply["vote"]:
+        votes[peer] = reply["signature"]
+    return reply["vote"]
+
+
+class InventoryNode:
+    def __init__(self, node, ports, data_dir=NODE_DATA_DIR, quorum=3, timeout=2.0):
+        self.node = node
+        self.keyring = paramcache.keyring(paramcache.load()).watch(KEYS_FILE)
+        self.peers = {name: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+        self.timeout = timeout
+        self.quorum = quorum
+        self.consensus = ConsensusEngine(quorum=quorum, timeout=timeout)
+        os.makedirs(data_dir, exist_ok=True)
+        self.replica = ReplicaLog(replica_base(node[-1], data_dir))
+        self.applied = IdempotencyLog(os.path.join(data_dir, f"idempotency_{node[-1].lower()}.log"))
+
+    def verify(self, payload):
+        proposer = payload["proposer"]
+        if proposer not in self.keyring:
+            return False
+        return cached_verify(payload["message"], payload["signature"], self.keyring[proposer].public_key)
+
+    def vote(self, payload):
+        if not self.verify(payload):
+            return {"vote": False}
+        return {"vote": True, "signature": sign_message(vote_message(payload["message"]), self.keyring[self.node])}
+
+    def valid_votes(self, message, votes):
+        expected = vote_message(message)
+        return [voter for voter, signature in votes.items()
+                if voter in self.keyring and cached_verify(expected, signature, self.keyring[voter].public_key)]
+
+    def propose(self, payload):
+        item_id = str(payload["item_id"])
+        qty = int(payload["qty"])
+        price = int(payload["price"])
+        # The token is signed with the record, so a commit cannot be replayed under a new one.
+        token = str(payload.get("idempotency_key") or new_token())
+        msg = transaction_message(item_id, qty, price, token)
+        signed = {"proposer": self.node, "message": msg, "signature": sign_message(msg, self.keyring[self.node])}
+
+        votes = {}
+        round_result = self.consensus.run({
+            peer: (request_vote, (url, signed, self.timeout, votes, peer)) for peer, url in self.peers.items()
+        })
+        committed = []
+        if round_result.accepted:
+            record = {"ID": item_id, "QTY": qty, "Price": price, "Location": self.node[-1]}
+            commit = dict(signed, record=record, token=token, votes=dict(votes))
+            with ThreadPoolExecutor(max_workers=len(self.peers)) as pool:
+                futures = {peer: pool.submit(post_json, url + "/commit", commit, self.timeout)
+                           for peer, url in self.peers.items()}
+            for peer, future in futures.items():
+                try:
+                    if future.result().get("committed"):
+                        committed.append(peer)
+                except (OSError, ValueError):
+                    pass
+        return {
+            "node": self.node,
+            "message": msg,
+            "signature": signed["signature"],
+            "verifications": round_result.verdicts,
+            "consensus": "Consensus Achieved" if round_result.accepted else "Consensus Failed",
+            "committed": committed,
+            "elapsed": round_result.elapsed,
+        }
+
+    def commit(self, payload):
+        # Verify the record itself rather than the message it arrived with,
+        # only let a node write records at its own location, and require a
+        # quorum of signed votes for exactly this message.
+        record = payload["record"]
+        if record["Location"] != payload["proposer"][-1]:
+            return False
+        message = transaction_message(record["ID"], int(record["QTY"]), int(record["Price"]), payload["token"])
+        if not self.verify(dict(payload, message=message)):
+            return False
+        if len(self.valid_votes(message, payload.get("votes", {}))) < self.quorum:
+            return False
+        txn_key = idempotency_key(payload["token"])
+        if self.applied.claim(txn_key):
+            try:
+                self.replica.upsert([record])
+            except Exception:
+                self.applied.release(txn_key)
+                raise
+            self.applied.confirm(txn_key)
+        return True
+
+    def health(self):
+        return {"node": self.node, "records": len(self.replica)}
+
+
+def make_handler(node):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, node.health())
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length))
+                if self.path == "/verify":
+                    self._reply(200, node.vote(payload))
+                elif self.path == "/commit":
+                    self._reply(200, {"committed": node.commit(payload)})
+                elif self.path == "/propose":
+                    self._reply(200, node.propose(payload))
+                else:
+                    self._reply(404, {"error": "not found"})
+            except (KeyError, TypeError, ValueError) as exc:
+                self._reply(400, {"error": str(exc)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve_node(node, ports, data_dir=NODE_DATA_DIR, quorum=3, timeout=2.0):
+    server = ThreadingHTTPServer(("127.0.0.1", ports[node]),
+                                 make_handler(InventoryNode(node, ports, data_dir, quorum, timeout)))
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def launch(ports, data_dir=NODE_DATA_DIR, quorum=3, timeout=2.0, wait=10.0):
+    ctx = multiprocessing.get_context("spawn")
+    procs = {}
+    for node in ports:
+        proc = ctx.Process(target=serve_node, args=(node, ports, data_dir, quorum, timeout), name=node, daemon=True)
+        proc.start()
+        procs[node] = proc
+    deadline = time.monotonic() + wait
+    for node, port in ports.items():
+        while True:
+            try:
+                get_json(f"http://127.0.0.1:{port}/health", timeout=0.5)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    shutdown(procs)
+                    raise RuntimeError(f"{node} did not come up on port {port}")
+                time.sleep(0.05)
+    return procs
+
+
+def shutdown(procs):
+    for proc in procs.values():
+        if proc.is_alive():
+            proc.terminate()
+    for proc in procs.values():
+        proc.join(timeout=5)
+
+
+def run_bench(ports, rounds, concurrency):
+    proposers = list(ports)
+    latencies = []
+    outcomes = {"accepted": 0, "rejected": 0, "errors": 0}
+
+    def one(i):
+        proposer = proposers[i % len(proposers)]
+        start = time.perf_counter()
+        try:
+            result = post_json(f"http://127.0.0.1:{ports[proposer]}/propose",
+                               {"item_id": f"N{i:06d}", "qty": i % 50 + 1, "price": i % 90 + 10}, timeout=10)
+        except (OSError, ValueError):
+            return None, time.perf_counter() - start
+        return result["consensus"] == "Consensus Achieved", time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for accepted, elapsed in pool.map(one, range(rounds)):
+            latencies.append(elapsed)
+            if accepted is None:
+                outcomes["errors"] += 1
+            else:
+                outcomes["accepted" if accepted else "rejected"] += 1
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e3
+    return dict(outcomes, rounds=rounds, throughput=rounds / total,
+                p50_ms=pct(0.50), p95_ms=pct(0.95), p99_ms=pct(0.99))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["serve", "bench"])
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--data-dir", default=NODE_DATA_DIR)
+    parser.add_argument("--quorum", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--kill", help="node to terminate before the benchmark, to test crash tolerance")
+    args = parser.parse_args(argv)
+
+    ports = node_ports(args.base_port)
+    procs = launch(ports, args.data_dir, args.quorum, args.timeout)
+    try:
+        if args.command == "serve":
+            print("nodes up: " + ", ".join(f"{node} on :{port}" for node, port in ports.items()))
+            for proc in procs.values():
+                proc.join()
+        else:
+            if args.kill:
+                procs[args.kill].terminate()
+                procs[args.kill].join()
+                ports = {node: port for node, port in ports.items() if node != args.kill}
+            print(json.dumps(run_bench(ports, args.rounds, args.concurrency), indent=2))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown(procs)
+
+
+if __name__ == "__main__":
+    main()
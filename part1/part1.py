@@ -1,8 +1,21 @@
-
-from flask import Flask, render_template, request
-import hashlib
+from flask import Flask, Response, jsonify, render_template, request
+import csv
+import io
 import json
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.anti_entropy import repair
+from common.backends import BACKEND, open_replicas
+from common.blocks import BlockChain, BlockProducer
+from common.consensus import ConsensusEngine
+from common.idempotency import IdempotencyLog, idempotency_key, new_token
+from common.metrics import CONTENT_TYPE, REGISTRY
+from common import paramcache
+from common.parameters import INVENTORY_KEYS, KEYS_FILE
+from common.signatures import (batch_verify, cached_verify, find_invalid_signatures, hash_message,
+                               sign_message, verify_signature)
 
 app = Flask(__name__)
 
@@ -21,41 +34,29 @@ def generate_rsa_keys(p, q, e):
     d = mod_inverse(e, phi)
     return (e, n), (d, n), n, phi, d
 
-def hash_message(msg):
-    return int(hashlib.sha256(msg.encode()).hexdigest(), 16)
-
-def sign_message(msg, private_key):
-    d, n = private_key
-    m = hash_message(msg)
-    return pow(m, d, n)
-
-def verify_signature(msg, sig, public_key):
-    e, n = public_key
-    m = hash_message(msg)
-    return pow(sig, e, n) == m
-
-inventory_keys = {
-    "Inventory A": {
-        "p": 1210613765735147311106936311866593978079938707,
-        "q": 1247842850282035753615951347964437248190231863,
-        "e": 815459040813953176289801
-    },
-    "Inventory B": {
-        "p": 787435686772982288169641922308628444877260947,
-        "q": 1325305233886096053310340418467385397239375379,
-        "e": 692450682143089563609787
-    },
-    "Inventory C": {
-        "p": 1014247300991039444864201518275018240361205111,
-        "q": 904030450302158058469475048755214591704639633,
-        "e": 1158749422015035388438057
-    },
-    "Inventory D": {
-        "p": 1287737200891425621338551020762858710281638317,
-        "q": 1330909125725073469794953234151525201084537607,
-        "e": 33981230465225879849295979
-    }
-}
+inventory_keys = INVENTORY_KEYS
+
+KEYRING = paramcache.keyring(paramcache.load()).watch(KEYS_FILE)
+CONSENSUS = ConsensusEngine(
+    quorum=int(os.environ.get("CONSENSUS_QUORUM", 3)),
+    timeout=float(os.environ.get("CONSENSUS_TIMEOUT", 2.0)),
+    executor=os.environ.get("CONSENSUS_EXECUTOR", "thread"),
+)
+REPLICAS = open_replicas(BACKEND)
+IDEMPOTENCY = IdempotencyLog()
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+def commit_records(records):
+    REPLICAS.commit(records)
+
+CHAIN = BlockChain(os.path.join("DATA", "chain.log"))
+STAGES = REGISTRY.histogram("part1_stage_seconds", "Time spent in each stage of a form submission", ["stage"])
+CONSENSUS_ROUNDS = REGISTRY.counter("part1_consensus_rounds", "Consensus rounds by outcome", ["outcome"])
+
+BLOCKS = BlockProducer(KEYRING, CHAIN, CONSENSUS, commit_records,
+                       max_size=int(os.environ.get("BLOCK_MAX_SIZE", 500)),
+                       max_wait=float(os.environ.get("BLOCK_MAX_WAIT", 2.0)),
+                       idempotency=IDEMPOTENCY)
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -67,52 +68,180 @@ def index():
         price = int(request.form["price"])
         msg = f"Item: {item_id} | QTY: {qty} | Price: {price}"
 
-        keys = inventory_keys[node]
-        pub_key, priv_key, n, phi, d = generate_rsa_keys(keys["p"], keys["q"], keys["e"])
-        signature = sign_message(msg, priv_key)
-
-        verifications = {}
-        consensus_count = 0
-        for other_node in inventory_keys:
-            is_valid = verify_signature(msg, signature, pub_key)
-            verifications[other_node] = "Accepted" if is_valid else "Rejected"
-            if is_valid:
-                consensus_count += 1
+        key = KEYRING[node]
+        pub_key = key.public_key
+        with STAGES.time(stage="hash"):
+            digest = hash_message(msg)
+        with STAGES.time(stage="sign"):
+            signature = key.private_op(digest)
 
-        consensus_success = consensus_count >= 3
+        with STAGES.time(stage="verify"):
+            round_result = CONSENSUS.run({other_node: (cached_verify, (msg, signature, pub_key)) for other_node in KEYRING})
+        verifications = round_result.verdicts
+        consensus_success = round_result.accepted
+        CONSENSUS_ROUNDS.inc(outcome="accepted" if consensus_success else "rejected")
         result = {
             "node": node,
             "message": msg,
             "signature": signature,
             "verifications": verifications,
             "consensus": "Consensus Achieved" if consensus_success else "Consensus Failed",
-            "n": n,
-            "phi": phi,
-            "d": d
+            "n": key.n,
+            "phi": key.phi,
+            "d": key.d
         }
 
         if consensus_success:
             location = node[-1]
             new_record = {"ID": item_id, "QTY": qty, "Price": price, "Location": location}
-            for inventory_file in [
-                os.path.join("DATA", "inventory_a.json"),
-                os.path.join("DATA", "inventory_b.json"),
-                os.path.join("DATA", "inventory_c.json"),
-                os.path.join("DATA", "inventory_d.json")
-            ]:
-                if os.path.exists(inventory_file):
-                    with open(inventory_file, "r") as f:
-                        try:
-                            data = json.load(f)
-                        except:
-                            data = []
+            # Re-sending the same form (same token) is a no-op; a new form is a new submission.
+            txn_key = idempotency_key(request.form.get("idempotency_key") or new_token())
+            if IDEMPOTENCY.claim(txn_key):
+                try:
+                    with STAGES.time(stage="storage"):
+                        REPLICAS.commit([new_record])
+                except Exception:
+                    IDEMPOTENCY.release(txn_key)
+                    raise
+                IDEMPOTENCY.confirm(txn_key)
+            else:
+                result["duplicate"] = True
+
+    with STAGES.time(stage="render"):
+        return render_template("part2.html", result=result, nodes=KEYRING.nodes(), token=new_token())
+
+BULK_FIELDS = ["node", "item_id", "qty", "price"]
+
+def read_bulk_rows():
+    upload = request.files.get("file")
+    if upload is not None:
+        body = upload.read().decode("utf-8-sig")
+        is_json = upload.filename.lower().endswith(".json")
+    else:
+        body = request.get_data(as_text=True)
+        is_json = request.is_json
+    if is_json:
+        rows = json.loads(body)
+        rows = rows["rows"] if isinstance(rows, dict) else rows
+        if not isinstance(rows, list):
+            raise ValueError("expected a list of rows")
+        return rows
+    return list(csv.DictReader(io.StringIO(body)))
+
+def parse_bulk_row(row):
+    missing = [field for field in BULK_FIELDS if row.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    node = str(row["node"]).strip()
+    if node not in KEYRING:
+        node = f"Inventory {node.upper()}"
+    if node not in KEYRING:
+        raise ValueError(f"unknown node {row['node']!r}")
+    item_id = str(row["item_id"]).strip()
+    try:
+        qty = int(row["qty"])
+        price = int(row["price"])
+    except (TypeError, ValueError):
+        raise ValueError("qty and price must be integers")
+    return node, item_id, qty, price
+
+@app.route("/bulk", methods=["POST"])
+def bulk():
+    try:
+        rows = read_bulk_rows()
+    except (ValueError, KeyError, TypeError) as exc:
+        return jsonify({"error": f"could not read upload: {exc}"}), 400
+
+    token = request.headers.get(IDEMPOTENCY_HEADER)
+    txn_key = idempotency_key(token) if token else None
+    if txn_key and not IDEMPOTENCY.claim(txn_key):
+        return jsonify({"duplicate": True, "accepted": 0, "rejected": 0, "rows": []})
+    try:
+        response = propose_bulk(rows)
+    except Exception:
+        if txn_key:
+            IDEMPOTENCY.release(txn_key)
+        raise
+    if txn_key:
+        IDEMPOTENCY.confirm(txn_key)
+    return jsonify(response)
+
+def propose_bulk(rows):
+    # Rows are applied in file order: a new run of blocks starts each time
+    # the node changes, so a later row for an item always wins.
+    results = []
+    runs = []
+    for i, row in enumerate(rows):
+        try:
+            node, item_id, qty, price = parse_bulk_row(row)
+        except (AttributeError, ValueError) as exc:
+            results.append({"row": i, "status": "rejected", "reason": str(exc)})
+            continue
+        results.append({"row": i, "node": node, "item_id": item_id, "status": None})
+        if not runs or runs[-1][0] != node:
+            runs.append((node, []))
+        runs[-1][1].append((i, {"ID": item_id, "QTY": qty, "Price": price, "Location": node[-1]}))
+
+    accepted = 0
+    for node, batch in runs:
+        rows_in_order = [i for i, _ in batch]
+        for header, round_result in BLOCKS.propose_many(node, [record for _, record in batch]):
+            CONSENSUS_ROUNDS.inc(outcome="accepted" if round_result.accepted else "rejected")
+            for i in rows_in_order[:header["count"]]:
+                results[i]["block"] = header["height"] if round_result.accepted else None
+                if round_result.accepted:
+                    results[i]["status"] = "accepted"
+                    accepted += 1
                 else:
-                    data = []
-                data.append(new_record)
-                with open(inventory_file, "w") as f:
-                    json.dump(data, f, indent=2)
+                    results[i]["status"] = "rejected"
+                    results[i]["reason"] = "consensus failed"
+            rows_in_order = rows_in_order[header["count"]:]
+
+    return {
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "rows": results,
+    }
+
+@app.route("/submit", methods=["POST"])
+def submit():
+    try:
+        node, item_id, qty, price = parse_bulk_row(request.get_json(force=True))
+    except (AttributeError, ValueError) as exc:
+        return jsonify({"error": str(exc)}), 400
+    token = request.headers.get(IDEMPOTENCY_HEADER)
+    txn_key = idempotency_key(token) if token else None
+    if txn_key and not IDEMPOTENCY.claim(txn_key):
+        return jsonify({"queued": False, "duplicate": True, "pending": BLOCKS.pending()})
+    # The producer confirms the key once the record's block commits.
+    BLOCKS.submit(node, {"ID": item_id, "QTY": qty, "Price": price, "Location": node[-1]}, key=txn_key)
+    return jsonify({"queued": True, "pending": BLOCKS.pending()}), 202
+
+@app.route("/blocks")
+def blocks():
+    start = request.args.get("start", 0, type=int)
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify({"height": len(CHAIN.headers), "tip": CHAIN.tip, "headers": CHAIN.headers[start:start + limit],
+                          "producer": BLOCKS.status()})
+
+@app.route("/proof/<item_id>")
+def proof(item_id):
+    found = CHAIN.proof(item_id)
+    if found is None:
+        return jsonify({"error": f"Item ID '{item_id}' is not in any block"}), 404
+    return jsonify(found)
+
+@app.route("/repair", methods=["POST"])
+def repair_replicas():
+    return jsonify(repair(REPLICAS, dry_run=request.args.get("dry_run") == "1"))
+
+@app.route("/audit")
+def audit():
+    return jsonify(CHAIN.audit(KEYRING))
 
-    return render_template("part2.html", result=result, nodes=list(inventory_keys.keys()))
+@app.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -1,39 +1,32 @@
 import os
 import json
+import sys
+import base64
 import hashlib
-from flask import Flask, render_template, request, session
+from flask import Flask, Response, jsonify, render_template, request, session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.cache import VERIFY_CACHE, VersionedCache
+from common.envelope import CHUNK_SIZE, decrypt_envelope, encrypt_envelope, iter_encrypt
+from common.metrics import CONTENT_TYPE, REGISTRY
+from common.backends import BACKEND, open_replicas
+from common import paramcache
 
 app = Flask(__name__)
 app.secret_key = "secrettt"
 
-def load_parameters(filepath="parameters.txt"):
-    section = None
-    identities = {}
-    randoms = {}
-    pkg_keys = {}
-    procurement_keys = {}
-
-    with open(filepath, "r") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            if line.startswith("[") and line.endswith("]"):
-                section = line[1:-1]
-                continue
-            key, val = line.split(",", 1)
-            val = int(val)
-            if section == "Identities":
-                identities[key] = val
-            elif section == "RandomValues":
-                randoms[key] = val
-            elif section == "PKGKeys":
-                pkg_keys[key] = val
-            elif section == "ProcurementKeys":
-                procurement_keys[key] = val
-    return identities, randoms, pkg_keys, procurement_keys
-
-IDENTITIES, RANDOM_VALUES, PKG_KEYS, PROCUREMENT_KEYS = load_parameters("parameters.txt")
+PARAMS = paramcache.load()
+IDENTITIES = PARAMS["identities"]
+PROCUREMENT_KEY = paramcache.procurement_key(PARAMS)
+MULTISIG = paramcache.multisig(PARAMS)
+STORE = open_replicas(BACKEND, readonly=True)
+
+RESULT_CACHE = VersionedCache(maxsize=int(os.environ.get("QUERY_CACHE_SIZE", 1024)),
+                              ttl=float(os.environ.get("QUERY_CACHE_TTL", 30.0)))
+
+STAGES = REGISTRY.histogram("part2_stage_seconds", "Time spent in each stage of an item lookup", ["stage"])
+MISMATCHES = REGISTRY.counter("part2_mismatches", "Items whose replicas disagree, by endpoint", ["endpoint"])
+VERIFICATIONS = REGISTRY.counter("part2_multisig_verifications", "Aggregate signature checks by outcome", ["outcome"])
 
 # old
 '''IDENTITIES = {
@@ -59,56 +52,12 @@ PROCUREMENT_KEYS = {
     "e": 106506253943651610547613
 }
 '''
-def mod_inverse(e, phi):
-    def egcd(a, b):
-        if a == 0: return b, 0, 1
-        g, x1, y1 = egcd(b % a, a)
-        return g, y1 - (b // a) * x1, x1
-    g, x, _ = egcd(e, phi)
-    return x % phi if g == 1 else None
-
-def generate_rsa_keys(p, q, e):
-    n = p * q
-    phi = (p - 1) * (q - 1)
-    d = mod_inverse(e, phi)
-    return (e, n), (d, n)
-
-def hash_message(msg, identity=None):
-    if identity:
-        msg += f"::{identity}"
-    return int(hashlib.sha256(msg.encode()).hexdigest(), 16)
-
-def generate_partial_signature(identity, r, message, n):
-    m = hash_message(message, identity)
-    return (m * pow(identity, r, n)) % n
-
-def aggregate_signatures(sigs, n):
-    return sum(sigs) % n
-
-def verify_multisig(agg_sig, messages, ids, randoms, n):
-    expected = 0
-    for inv in ids:
-        m = hash_message(messages[inv], ids[inv])
-        expected = (expected + m * pow(ids[inv], randoms[inv], n)) % n
-    return agg_sig == expected
-
-def encrypt(message, pub_key):
-    e, n = pub_key
-    m = int.from_bytes(message.encode(), "big")
-    return pow(m, e, n)
-
-def decrypt(ciphertext, priv_key):
-    d, n = priv_key
-    m = pow(ciphertext, d, n)
-    return m.to_bytes((m.bit_length() + 7) // 8, "big").decode()
-
 def load_record(inv_key, item_id):
-    filename = os.path.join("DATA", f"inventory_{inv_key.lower()}.json")
-    if not os.path.exists(filename):
-        return None
-    with open(filename) as f:
-        data = json.load(f)
-    return next((item for item in data if item["ID"] == item_id), None)
+    return STORE.lookup(inv_key, item_id)
+
+def render_task3(result):
+    with STAGES.time(stage="render"):
+        return render_template("task3.html", result=result, last_item_id=session.get("last_item_id", ""))
 
 @app.route("/", methods=["GET", "POST"])
 def task3_ui():
@@ -117,70 +66,209 @@ def task3_ui():
         item_id = request.form["item_id"].strip()
         session["last_item_id"] = item_id
 
-        pkg_n = PKG_KEYS["p"] * PKG_KEYS["q"]
-        partial_sigs, partial_log, messages = [], [], {}
-        records = {}
+        # Read the versions before the records, so a concurrent commit can only
+        # make the stored result look older than it is, never newer.
+        versions = STORE.versions(item_id)
+        result = RESULT_CACHE.lookup(item_id, versions)
+        if result is None:
+            result = lookup_item(item_id)
+            RESULT_CACHE.store(item_id, versions, result)
 
-        for key in ["A", "B", "C", "D"]:
-            label = f"Inventory {key}"
-            record = load_record(key, item_id)
+    return render_task3(result)
 
-            if not record:
-                result["error"] = f"Item ID '{item_id}' not found in {label}"
-                return render_template("task3.html", result=result, last_item_id=session.get("last_item_id", ""))
+def lookup_item(item_id):
+    result = {}
+    partial_sigs, partial_log, messages = [], [], {}
+    records = {}
 
-            records[label] = record
+    with STAGES.time(stage="storage"):
+        for key in ["A", "B", "C", "D"]:
+            records[f"Inventory {key}"] = load_record(key, item_id)
+    for label, record in records.items():
+        if not record:
+            result["error"] = f"Item ID '{item_id}' not found in {label}"
+            return result
 
-        # Compare fields for mismatches
-        base_record = next(iter(records.values()))
-        mismatches = []
+    # Compare fields for mismatches
+    base_record = next(iter(records.values()))
+    mismatches = []
 
-        for label, rec in records.items():
-            for field in ["QTY", "Price", "Location"]:
-                if rec[field] != base_record[field]:
-                    mismatches.append(f"{label} → {field} = {rec[field]} (expected {base_record[field]})")
+    for label, rec in records.items():
+        for field in ["QTY", "Price", "Location"]:
+            if rec[field] != base_record[field]:
+                mismatches.append(f"{label} → {field} = {rec[field]} (expected {base_record[field]})")
 
-        ref_vals = [f"Inventory A → {field} = {base_record[field]}" for field in ["QTY", "Price", "Location"]]
-        if mismatches:
-            result["error"] = ("<div><strong>Reference (Inventory A):</strong><ul>" + "".join(f"<li>{r}</li>" for r in ref_vals) + "</ul></div>" +
-                "Mismatch detected in inventory data across nodes:<br><ul>" +
-                "".join(f"<li>{m}</li>" for m in mismatches) +
-                "</ul>Please ensure QTY, Price, and Location are consistent in all inventories."
-            )
-            return render_template("task3.html", result=result, last_item_id=session.get("last_item_id", ""))
+    ref_vals = [f"Inventory A → {field} = {base_record[field]}" for field in ["QTY", "Price", "Location"]]
+    if mismatches:
+        MISMATCHES.inc(endpoint="task3")
+        result["error"] = ("<div><strong>Reference (Inventory A):</strong><ul>" + "".join(f"<li>{r}</li>" for r in ref_vals) + "</ul></div>" +
+            "Mismatch detected in inventory data across nodes:<br><ul>" +
+            "".join(f"<li>{m}</li>" for m in mismatches) +
+            "</ul>Please ensure QTY, Price, and Location are consistent in all inventories."
+        )
+        return result
 
+    with STAGES.time(stage="sign"):
         for label, record in records.items():
             msg = f"Item: {item_id}, QTY: {record['QTY']}, Location: {record['Location']}"
             messages[label] = msg
 
-            r = RANDOM_VALUES[label]
-            identity = IDENTITIES[label]
-            sig = generate_partial_signature(identity, r, msg, pkg_n)
+            sig = MULTISIG.sign(label, msg)
 
             partial_sigs.append(sig)
             partial_log.append(f"{label} ➜ {sig}")
 
-        agg = aggregate_signatures(partial_sigs, pkg_n)
-        verified = verify_multisig(agg, messages, IDENTITIES, RANDOM_VALUES, pkg_n)
-
-        po_pub, po_priv = generate_rsa_keys(**PROCUREMENT_KEYS)
-        encrypted = encrypt(messages["Inventory A"], po_pub)
-        decrypted = decrypt(encrypted, po_priv)
-
-        result = {
-            "item_id": item_id,
-            "qty": base_record["QTY"],
-            "price": base_record["Price"],
-            "location": base_record["Location"],
-            "message": messages["Inventory A"],
-            "partial_log": partial_log,
-            "aggregated": agg,
-            "verified": verified,
-            "encrypted": encrypted,
-            "decrypted": decrypted
-        }
-
-    return render_template("task3.html", result=result, last_item_id=session.get("last_item_id", ""))
+        agg = MULTISIG.aggregate(partial_sigs)
+    with STAGES.time(stage="verify"):
+        verified = MULTISIG.verify(agg, messages)
+    VERIFICATIONS.inc(outcome="verified" if verified else "failed")
+
+    with STAGES.time(stage="encrypt"):
+        # Envelope encryption, as /query uses: textbook RSA on the message itself
+        # fails once it is longer than the ~300-bit modulus.
+        encrypted = encrypt_envelope(messages["Inventory A"].encode(), PROCUREMENT_KEY.public_key)
+        decrypted = decrypt_envelope(encrypted, PROCUREMENT_KEY).decode()
+
+    result = {
+        "item_id": item_id,
+        "qty": base_record["QTY"],
+        "price": base_record["Price"],
+        "location": base_record["Location"],
+        "message": messages["Inventory A"],
+        "partial_log": partial_log,
+        "aggregated": agg,
+        "verified": verified,
+        "encrypted": encrypted.hex(),
+        "decrypted": decrypted
+    }
+    return result
+
+QUERY_FIELDS = ["QTY", "Price", "Location"]
+WHERE_TYPES = {"ID": str, "QTY": int, "Price": int, "Location": str}
+
+def validate_where(where):
+    for field, cond in where.items():
+        if field not in WHERE_TYPES:
+            raise ValueError(f"unknown field {field!r}")
+        expected = WHERE_TYPES[field]
+        if isinstance(cond, dict):
+            if expected is not int:
+                raise ValueError(f"{field} only supports equality")
+            if not cond or set(cond) - {"min", "max"}:
+                raise ValueError(f"{field} range takes 'min' and/or 'max'")
+            operands = cond.values()
+        else:
+            operands = [cond]
+        # bool is an int subclass, but True is not a quantity.
+        if any(isinstance(v, bool) or not isinstance(v, expected) for v in operands):
+            raise ValueError(f"{field} expects {'an integer' if expected is int else 'a string'}")
+
+def build_predicate(where):
+    def matches(record):
+        for field, cond in where.items():
+            value = record.get(field)
+            if isinstance(cond, dict):
+                if "min" in cond and (value is None or value < cond["min"]):
+                    return False
+                if "max" in cond and (value is None or value > cond["max"]):
+                    return False
+            elif value != cond:
+                return False
+        return True
+    return matches
+
+def result_digest(items):
+    canonical = json.dumps(sorted(items, key=lambda r: r["ID"]), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+@app.route("/query", methods=["POST"])
+def query():
+    body = request.get_json(force=True, silent=True) or {}
+    item_ids = body.get("item_ids")
+    where = body.get("where")
+    if not isinstance(item_ids, list) and not isinstance(where, dict):
+        return jsonify({"error": "expected 'item_ids' (a list) or 'where' (an object)"}), 400
+    if not isinstance(item_ids, list):
+        try:
+            validate_where(where)
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+
+    # One pass per replica: a batch of index lookups, or one filtered scan.
+    views = {}
+    for key in ["A", "B", "C", "D"]:
+        if isinstance(item_ids, list):
+            views[key] = STORE.get_many(key, [str(i).strip() for i in item_ids])
+        else:
+            location = where.get("Location") if not isinstance(where.get("Location"), dict) else None
+            views[key] = {r["ID"]: r for r in STORE.scan(key, build_predicate(where), location)}
+
+    ids = sorted(set().union(*(view.keys() for view in views.values())))
+    items, missing, mismatches = [], {}, {}
+    for item_id in ids:
+        records = {f"Inventory {key}": views[key].get(item_id) for key in views}
+        absent = [label for label, rec in records.items() if rec is None]
+        if absent:
+            missing[item_id] = absent
+            continue
+        base_record = records["Inventory A"]
+        diffs = [f"{label} → {field} = {rec[field]} (expected {base_record[field]})"
+                 for label, rec in records.items() for field in QUERY_FIELDS if rec[field] != base_record[field]]
+        if diffs:
+            MISMATCHES.inc(endpoint="query")
+            mismatches[item_id] = diffs
+        else:
+            items.append(base_record)
+
+    digest = result_digest(items)
+    msg = f"Query digest: {digest}"
+    messages = {label: msg for label in IDENTITIES}
+    partial_sigs = MULTISIG.sign_round(messages)
+    agg = MULTISIG.aggregate(partial_sigs.values())
+    verified = MULTISIG.verify(agg, messages)
+    VERIFICATIONS.inc(outcome="verified" if verified else "failed")
+
+    response = {
+        "items": items,
+        "missing": missing,
+        "mismatches": mismatches,
+        "digest": digest,
+        "aggregated": agg,
+        "verified": verified,
+    }
+    if request.args.get("stream") == "1":
+        chunks = json_chunks(json.JSONEncoder().iterencode(response))
+        return Response(iter_encrypt(chunks, PROCUREMENT_KEY.public_key), mimetype="application/octet-stream")
+
+    encrypted = encrypt_envelope(json.dumps(response).encode(), PROCUREMENT_KEY.public_key)
+    decrypted = json.loads(decrypt_envelope(encrypted, PROCUREMENT_KEY))
+    return jsonify(dict(response,
+                        partial_signatures=partial_sigs,
+                        encrypted_response=base64.b64encode(encrypted).decode(),
+                        decrypted_matches=decrypted == response))
+
+def json_chunks(pieces, size=CHUNK_SIZE):
+    buf, length = [], 0
+    for piece in pieces:
+        buf.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield "".join(buf).encode()
+            buf, length = [], 0
+    if buf:
+        yield "".join(buf).encode()
+
+@app.route("/store/footprint")
+def store_footprint():
+    return jsonify(STORE.footprint())
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify({"results": RESULT_CACHE.stats(), "verifications": VERIFY_CACHE.stats()})
+
+@app.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,143 @@
+import os
+
+import pytest
+
+from common.commitlog import CommitLog, CommitLogGap, CommitLogLocked, CursorReplica
+
+
+def record(item_id, qty, location="A"):
+    return {"ID": item_id, "QTY": qty, "Price": 1, "Location": location}
+
+
+def upsert(*records):
+    return {"op": "upsert", "records": list(records)}
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return str(tmp_path / "commitlog")
+
+
+def seqs(log, start=1):
+    return [entry["seq"] for entry, _ in log.read_from(start)]
+
+
+def test_second_writer_fails_fast(log_dir):
+    log = CommitLog(log_dir)
+    with pytest.raises(CommitLogLocked):
+        CommitLog(log_dir)
+    follower = CommitLog(log_dir, readonly=True)
+    log.append(upsert(record("001", 1)))
+    assert seqs(follower) == [1]
+    log.close()
+    reopened = CommitLog(log_dir)
+    assert reopened.append(upsert(record("002", 1))) == 2
+    reopened.close()
+
+
+def test_torn_tail_is_truncated_on_open(log_dir):
+    log = CommitLog(log_dir)
+    for i in range(3):
+        log.append(upsert(record(f"{i:03d}", i)))
+    path = log._segment_path(log.segments()[-1])
+    good_size = os.path.getsize(path)
+    log.close()
+    with open(path, "ab") as f:
+        f.write(b"\x00\x00\x01\x00partial entry")
+
+    log = CommitLog(log_dir)
+    assert log.last_seq == 3
+    assert os.path.getsize(path) == good_size
+    assert log.append(upsert(record("003", 3))) == 4
+    assert seqs(log) == [1, 2, 3, 4]
+    log.close()
+
+
+def test_read_from_crosses_segments(log_dir):
+    log = CommitLog(log_dir, segment_bytes=1)
+    for i in range(5):
+        log.append(upsert(record(f"{i:03d}", i)))
+    assert log.segments() == [1, 2, 3, 4, 5]
+    assert seqs(log) == [1, 2, 3, 4, 5]
+    assert seqs(log, 3) == [3, 4, 5]
+
+    # Resuming from a position in an earlier segment moves on to the next one.
+    entries = list(log.read_from(2))
+    _, position = entries[0]
+    assert [entry["seq"] for entry, _ in log.read_from(3, position)] == [3, 4, 5]
+    log.close()
+
+
+def test_read_from_resumes_within_a_segment(log_dir):
+    log = CommitLog(log_dir)
+    for i in range(4):
+        log.append(upsert(record(f"{i:03d}", i)))
+    _, position = list(log.read_from(2))[0]
+    assert [entry["seq"] for entry, _ in log.read_from(3, position)] == [3, 4]
+    log.close()
+
+
+def test_prune_keeps_segments_past_applied(log_dir):
+    log = CommitLog(log_dir, segment_bytes=1)
+    for i in range(5):
+        log.append(upsert(record(f"{i:03d}", i)))
+    assert log.prune(3) == 3
+    assert log.segments() == [4, 5]
+    assert log.first_seq() == 4
+    with pytest.raises(CommitLogGap):
+        list(log.read_from(2))
+    assert seqs(log, 4) == [4, 5]
+    log.close()
+
+
+def test_lagging_follower_reloads_checkpoint_after_prune(tmp_path, log_dir):
+    base = str(tmp_path / "inventory_a")
+    log = CommitLog(log_dir, segment_bytes=1)
+    writer = CursorReplica(base, "A", log, checkpoint_every=1)
+    follower = CursorReplica(base, "A", CommitLog(log_dir, readonly=True), readonly=True)
+
+    for i in range(4):
+        log.append(upsert(record(f"{i:03d}", i)))
+    writer.catch_up()
+    writer.checkpoint()
+    log.prune(writer.checkpointed)
+    assert follower.cursor == 0
+    with pytest.raises(CommitLogGap):
+        list(log.read_from(follower.cursor + 1))
+
+    log.append(upsert(record("000", 10)))
+    writer.catch_up()
+    follower.catch_up()
+    assert follower.cursor == writer.cursor == 5
+    assert sorted(map(str, follower)) == sorted(map(str, writer))
+    assert follower.get_all("000") == [record("000", 10)]
+    log.close()
+
+
+def test_follower_behind_checkpoint_reports_gap(tmp_path, log_dir):
+    base = str(tmp_path / "inventory_a")
+    log = CommitLog(log_dir, segment_bytes=1)
+    writer = CursorReplica(base, "A", log, checkpoint_every=1000)
+    follower = CursorReplica(base, "A", CommitLog(log_dir, readonly=True), readonly=True)
+
+    for i in range(4):
+        log.append(upsert(record(f"{i:03d}", i)))
+    # Pruned past what any checkpoint covers: replaying cannot close the gap.
+    log.prune(3)
+    with pytest.raises(CommitLogGap):
+        follower.catch_up()
+    assert writer.checkpointed == 0
+    log.close()
+
+
+def test_entries_for_other_replicas_are_skipped(tmp_path, log_dir):
+    log = CommitLog(log_dir)
+    a = CursorReplica(str(tmp_path / "inventory_a"), "A", log)
+    b = CursorReplica(str(tmp_path / "inventory_b"), "B", log)
+    log.append(upsert(record("001", 1)))
+    log.append(dict(upsert(record("001", 2, "B")), replica="B"))
+    a.catch_up()
+    b.catch_up()
+    assert a.get_all("001") == [record("001", 1)]
+    assert b.get_all("001") == [record("001", 2, "B")]
+    log.close()
@@ -0,0 +1,27 @@
+import json
+
+from common.backends import open_replicas
+from common.export import export
+
+
+def test_export_writes_commitlog_state_to_json(tmp_path):
+    data_dir = str(tmp_path)
+    seed = [{"ID": "001", "QTY": 1, "Price": 5, "Location": "A"}]
+    for letter in "abcd":
+        with open(tmp_path / f"inventory_{letter}.json", "w") as f:
+            json.dump(seed, f)
+
+    writer = open_replicas("commitlog", data_dir=data_dir)
+    writer.commit([{"ID": "001", "QTY": 9, "Price": 5, "Location": "B"},
+                   {"ID": "002", "QTY": 2, "Price": 6, "Location": "B"}])
+    # Read-only, so it runs alongside the writer that holds the log lock.
+    follower = open_replicas("commitlog", readonly=True, data_dir=data_dir)
+    report = export(follower, data_dir)
+    follower.close()
+    writer.close()
+
+    assert {letter: entry["records"] for letter, entry in report.items()} == dict.fromkeys("ABCD", 2)
+    for letter in "abcd":
+        with open(tmp_path / f"inventory_{letter}.json") as f:
+            assert json.load(f) == [{"ID": "001", "QTY": 9, "Price": 5, "Location": "B"},
+                                    {"ID": "002", "QTY": 2, "Price": 6, "Location": "B"}]
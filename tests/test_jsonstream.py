@@ -0,0 +1,81 @@
+import io
+import json
+import os
+
+import pytest
+
+from common import jsonstream
+
+RECORDS = [
+    {"ID": "001", "QTY": 32, "Price": 12, "Location": "D"},
+    {"ID": "002", "QTY": 20, "Price": 14, "Location": "C"},
+    {"ID": "003", "QTY": 22, "Price": 17, "Location": "B"},
+]
+
+
+def records_from(text, chunk_size=jsonstream.CHUNK_SIZE):
+    return list(jsonstream.iter_records(io.StringIO(text), chunk_size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16, 64])
+def test_records_crossing_chunk_boundaries(chunk_size):
+    text = json.dumps(RECORDS, indent=2)
+    assert records_from(text, chunk_size) == RECORDS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 5])
+def test_bare_values_crossing_chunk_boundaries(chunk_size):
+    assert records_from("[12345, true, null, \"x\"]", chunk_size) == [12345, True, None, "x"]
+
+
+def test_empty_inputs():
+    assert records_from("") == []
+    assert records_from("  \n") == []
+    assert records_from("[]") == []
+    assert records_from("[ \n ]") == []
+
+
+@pytest.mark.parametrize("text", [
+    '{"ID": "001"}',
+    '[{"ID": "001"} {"ID": "002"}]',
+    '[{"ID": "001"},',
+    '[{"ID": "001"',
+    '[{"ID": "001"}',
+])
+def test_malformed_input_raises(text):
+    with pytest.raises(ValueError):
+        records_from(text, chunk_size=4)
+
+
+def test_write_array_matches_json_dump():
+    out = io.StringIO()
+    assert jsonstream.write_array(RECORDS, out) == len(RECORDS)
+    assert out.getvalue() == json.dumps(RECORDS, indent=2)
+    out = io.StringIO()
+    jsonstream.write_array([], out)
+    assert out.getvalue() == json.dumps([], indent=2)
+
+
+def test_rewrite_replaces_file(tmp_path):
+    path = str(tmp_path / "inventory_a.json")
+    with open(path, "w") as f:
+        json.dump(RECORDS, f, indent=2)
+    count = jsonstream.rewrite(path, (r for r in jsonstream.read_records(path) if r["ID"] != "002"))
+    assert count == 2
+    assert list(jsonstream.read_records(path)) == [RECORDS[0], RECORDS[2]]
+    assert os.listdir(tmp_path) == ["inventory_a.json"]
+
+
+def test_failed_rewrite_keeps_original(tmp_path):
+    path = str(tmp_path / "inventory_a.json")
+    with open(path, "w") as f:
+        json.dump(RECORDS, f, indent=2)
+
+    def broken():
+        yield RECORDS[0]
+        raise RuntimeError("transform failed")
+
+    with pytest.raises(RuntimeError):
+        jsonstream.rewrite(path, broken())
+    assert list(jsonstream.read_records(path)) == RECORDS
+    assert os.listdir(tmp_path) == ["inventory_a.json"]